@@ -1,6 +1,9 @@
 import streamlit as st
 import os
-from tools import process_pdf_document, retrieve_relevant_chunks, highlight_matching_chunks, get_pdf_download_link
+from tools import process_pdf_document, retrieve_relevant_chunks, highlight_matching_chunks, embed_query
+from index_manifest import document_namespace, document_digest
+from llm import ERROR_RESPONSE, NO_CHUNKS_RESPONSE
+from tracing import tracer
 
 def init_session_state():
     """Initialize session state variables"""
@@ -14,6 +17,20 @@ def init_session_state():
         st.session_state.highlighted_chunks = []
     if 'document_source' not in st.session_state:
         st.session_state.document_source = None
+    if 'indexed_document' not in st.session_state:
+        st.session_state.indexed_document = None
+    if 'document_namespace' not in st.session_state:
+        st.session_state.document_namespace = None
+    if 'last_trace' not in st.session_state:
+        st.session_state.last_trace = None
+    if 'ingestion_job' not in st.session_state:
+        st.session_state.ingestion_job = None
+    if 'finished_ingestion_job' not in st.session_state:
+        st.session_state.finished_ingestion_job = None
+    if 'document_file' not in st.session_state:
+        st.session_state.document_file = None
+    if 'upload_digest' not in st.session_state:
+        st.session_state.upload_digest = None
 
 def create_ui(app_title, file_size_limit_mb):
     """Create the main UI components"""
@@ -21,7 +38,7 @@ def create_ui(app_title, file_size_limit_mb):
     st.title(f"{app_title} 📄")
     st.markdown("Upload a PDF and ask questions about its content!")
 
-def load_example_resume(tokenizer, embedding_model, pinecone_index, chunk_size, chunk_overlap):
+def load_example_resume(tokenizer, embedding_model, pinecone_index, chunk_size, chunk_overlap, document_namespaces=False, **ingest_options):
     """Load the example resume for testing"""
     example_resume_path = "./Arul Akash(AI_ML Developer).pdf"  # Path to your example resume
     
@@ -31,14 +48,18 @@ def load_example_resume(tokenizer, embedding_model, pinecone_index, chunk_size,
     
     try:
         with open(example_resume_path, "rb") as file:
+            namespace = document_namespace(file.read()) if document_namespaces else None
+            file.seek(0)
             with st.spinner("Processing Resume..."):
                 success, chunk_count = process_pdf_document(
-                    file, tokenizer, embedding_model, pinecone_index, chunk_size, chunk_overlap
+                    file, tokenizer, embedding_model, pinecone_index, chunk_size, chunk_overlap, namespace=namespace, **ingest_options
                 )
                 
                 if success:
                     st.session_state.document_loaded = True
                     st.session_state.document_name = "Arul_Akash_Resume.pdf"
+                    st.session_state.indexed_document = file.name
+                    st.session_state.document_namespace = namespace
                     st.session_state.success_message = "✅ Ready to Rock!"
                     st.session_state.chunk_count = chunk_count
                     return True
@@ -49,8 +70,53 @@ def load_example_resume(tokenizer, embedding_model, pinecone_index, chunk_size,
         st.error(f"Error loading example resume: {str(e)}")
         return False
 
-def create_sidebar(tokenizer, embedding_model, pinecone_index, chunk_size, chunk_overlap, file_size_limit_mb):
-    """Create the sidebar upload functionality"""
+@st.fragment(run_every=1.0)
+def show_ingestion_progress(ingestion_worker, job_id):
+    """Poll a background ingestion job and rerun the app once it has finished"""
+    job = ingestion_worker.get(job_id)
+    if job is None or job.finished:
+        st.rerun()
+    snapshot = job.snapshot()
+    progress = snapshot["progress"]
+    total_pages = snapshot["total_pages"]
+    if snapshot["status"] == "queued":
+        st.info(f"⏳ '{snapshot['document_name']}' is queued for processing...")
+        return
+    fraction = min(progress["pages"] / total_pages, 1.0) if total_pages else 0.0
+    st.progress(fraction, text=f"Processing '{snapshot['document_name']}'...")
+    st.caption(
+        f"Pages {progress['pages']}/{total_pages or '?'} · Chunks {progress['chunks']} · "
+        f"Embedded {progress['embedded']} · Vectors written {progress['vectors']}"
+    )
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def load_stored_file(_file_store, digest):
+    """Bytes of a stored file, read once and shared by all sessions and reruns"""
+    return _file_store.read(digest)
+
+def show_pdf_download(file_store, digest, file_name):
+    """Offer a stored PDF for download"""
+    if file_store is None or digest is None:
+        return
+    try:
+        data = load_stored_file(file_store, digest)
+    except FileNotFoundError:
+        return
+    # The bytes are cached, so record the use on disk for the store's LRU eviction
+    if not file_store.touch(digest):
+        file_store.put(data, digest)
+    st.download_button("Download PDF", data=data, file_name=file_name, mime="application/pdf")
+
+def create_sidebar(tokenizer, embedding_model, pinecone_index, chunk_size, chunk_overlap, file_size_limit_mb, ingestion_worker=None, document_namespaces=False, file_store=None, **ingest_options):
+    """Create the sidebar upload functionality
+
+    With an ingestion_worker, uploads are indexed in the background and their
+    progress is shown until they are ready; the example resume is still
+    processed synchronously. With document_namespaces, each document is
+    indexed into its own namespace and the session's questions only search it.
+    Processed uploads are kept in file_store and offered for download from there.
+    Extra keyword arguments are forwarded to process_pdf_document.
+    """
     with st.sidebar:
         st.header("📁 Document Upload")
 
@@ -101,7 +167,7 @@ def create_sidebar(tokenizer, embedding_model, pinecone_index, chunk_size, chunk
                         use_container_width=True,
                         type="primary",
                         disabled=resume_button_disabled):
-                success = load_example_resume(tokenizer, embedding_model, pinecone_index, chunk_size, chunk_overlap)
+                success = load_example_resume(tokenizer, embedding_model, pinecone_index, chunk_size, chunk_overlap, document_namespaces, **ingest_options)
                 if success:
                     st.session_state.document_source = 'resume'
                     # Success message will be shown outside of this if block
@@ -135,30 +201,62 @@ def create_sidebar(tokenizer, embedding_model, pinecone_index, chunk_size, chunk
                 elif st.session_state.document_name != uploaded_file.name:
                     st.session_state.document_loaded = False
                     st.session_state.document_name = uploaded_file.name
+                    st.session_state.document_file = None
                 
-                if not st.session_state.document_loaded:
+                # Hash each upload once rather than on every rerun
+                if st.session_state.upload_digest is None or st.session_state.upload_digest[0] != uploaded_file.file_id:
+                    st.session_state.upload_digest = (uploaded_file.file_id, document_digest(uploaded_file.getvalue()))
+                digest = st.session_state.upload_digest[1]
+                namespace = document_namespace(digest=digest) if document_namespaces else None
+                if not st.session_state.document_loaded and ingestion_worker is not None:
+                    # Submitting again on reruns is safe: the worker dedups by content
+                    job = ingestion_worker.submit(
+                        uploaded_file.getvalue(), uploaded_file.name,
+                        tokenizer, embedding_model, pinecone_index, chunk_size, chunk_overlap,
+                        job_id=digest, namespace=namespace, **ingest_options
+                    )
+                    st.session_state.ingestion_job = job.id
+                    if job.status == "done":
+                        st.session_state.document_loaded = True
+                        st.session_state.document_source = 'upload'
+                        st.session_state.indexed_document = job.document_name
+                        st.session_state.document_namespace = namespace
+                        st.session_state.ingestion_job = None
+                        st.session_state.finished_ingestion_job = job.id
+                        st.success(f"✅ Document '{uploaded_file.name}' processed into {job.chunk_count} chunks!")
+
+                        if file_store is not None:
+                            st.session_state.document_file = file_store.put(uploaded_file.getvalue(), digest)
+                        show_pdf_download(file_store, st.session_state.document_file, uploaded_file.name)
+                    elif job.status == "failed":
+                        st.session_state.ingestion_job = None
+                        st.session_state.finished_ingestion_job = job.id
+                        st.error(f"❌ Failed to process document: {job.error}")
+                    else:
+                        show_ingestion_progress(ingestion_worker, job.id)
+                elif not st.session_state.document_loaded:
                     with st.spinner("Processing document..."):
                         success, chunk_count = process_pdf_document(
-                            uploaded_file, tokenizer, embedding_model, pinecone_index, chunk_size, chunk_overlap
+                            uploaded_file, tokenizer, embedding_model, pinecone_index, chunk_size, chunk_overlap, namespace=namespace, **ingest_options
                         )
                         if success:
                             st.session_state.document_loaded = True
                             st.session_state.document_source = 'upload'
+                            st.session_state.indexed_document = uploaded_file.name
+                            st.session_state.document_namespace = namespace
                             # Create a container for the success message and store it in session state
                             st.success(f"✅ Document '{uploaded_file.name}' processed into {chunk_count} chunks!")
 
-                            with open(uploaded_file.name, "wb") as f:
-                                f.write(uploaded_file.getvalue())
-                            
-                            st.markdown(get_pdf_download_link(uploaded_file.name), unsafe_allow_html=True)
+                            if file_store is not None:
+                                st.session_state.document_file = file_store.put(uploaded_file.getvalue(), digest)
+                            show_pdf_download(file_store, st.session_state.document_file, uploaded_file.name)
                         else:
                             st.error("❌ Failed to process document")
                 else:
                     # Show success message consistently for uploaded file
                     st.success(f"✅ Document '{uploaded_file.name}' is loaded and ready for questions!")
 
-                    if os.path.exists(uploaded_file.name):
-                        st.markdown(get_pdf_download_link(uploaded_file.name), unsafe_allow_html=True)
+                    show_pdf_download(file_store, st.session_state.document_file, uploaded_file.name)
                 
                 return uploaded_file
         elif st.session_state.document_source == 'upload':
@@ -168,7 +266,7 @@ def create_sidebar(tokenizer, embedding_model, pinecone_index, chunk_size, chunk
         return None
 
 
-def load_example_resume(tokenizer, embedding_model, pinecone_index, chunk_size, chunk_overlap):
+def load_example_resume(tokenizer, embedding_model, pinecone_index, chunk_size, chunk_overlap, document_namespaces=False, **ingest_options):
     """Load the example resume for testing"""
     example_resume_path = "./Arul Akash(AI_ML Developer).pdf"  # Path to your example resume
     
@@ -178,14 +276,18 @@ def load_example_resume(tokenizer, embedding_model, pinecone_index, chunk_size,
     
     try:
         with open(example_resume_path, "rb") as file:
+            namespace = document_namespace(file.read()) if document_namespaces else None
+            file.seek(0)
             with st.spinner("Processing My Resume..."):
                 success, chunk_count = process_pdf_document(
-                    file, tokenizer, embedding_model, pinecone_index, chunk_size, chunk_overlap
+                    file, tokenizer, embedding_model, pinecone_index, chunk_size, chunk_overlap, namespace=namespace, **ingest_options
                 )
                 
                 if success:
                     st.session_state.document_loaded = True
                     st.session_state.document_name = "Arul_Akash_Resume.pdf"
+                    st.session_state.indexed_document = file.name
+                    st.session_state.document_namespace = namespace
                     # Display success message right after loading
                     st.success("✅ Ready to Rock!")
                     return True
@@ -196,8 +298,49 @@ def load_example_resume(tokenizer, embedding_model, pinecone_index, chunk_size,
         st.error(f"Error loading example resume: {str(e)}")
         return False
 
-def create_chat_interface(groq_client, tokenizer, embedding_model, pinecone_index, llm_model, generate_response_func):
-    """Create the chat interface for Q&A"""
+def format_latency(latency):
+    """Format streamed-response timings for display under an answer"""
+    first_token = latency.get("first_token")
+    first_token_text = f"{first_token:.2f}s" if first_token is not None else "n/a"
+    text = f"⏱️ First token {first_token_text} · Total {latency['total']:.2f}s"
+    if latency.get("prompt_tokens"):
+        text += f" · Prompt {latency['prompt_tokens']} tokens"
+    if latency.get("tokens_saved"):
+        text += f" · Compression saved {latency['tokens_saved']} tokens"
+    return text
+
+def show_source_chunks(chunks, chunk_store=None, index=None):
+    """List source chunks, given as chunk dicts or as ChunkRefs resolved against chunk_store (or index)"""
+    with st.expander("View Source Chunks"):
+        for i, chunk in enumerate(chunks):
+            st.markdown(f"**Source Chunk {i+1}** (from {chunk['source'] if isinstance(chunk, dict) else chunk.source}):")
+            text = chunk["text"] if isinstance(chunk, dict) else chunk_store.get(chunk, index)
+            if text is None:
+                st.caption("This chunk is no longer in the index.")
+            else:
+                st.text(text)
+
+def compress_context(context_compressor, query, chunks):
+    """Shrink retrieved chunks to their relevant sentences when a compressor is configured"""
+    if context_compressor is None or not chunks:
+        return chunks, None
+    return context_compressor.compress(query, chunks)
+
+def create_chat_interface(groq_client, tokenizer, embedding_model, pinecone_index, llm_model, generate_response_func, stream_response_func=None, query_cache=None, answer_cache=None, context_compressor=None, manifest_store=None, chunk_store=None, **retrieval_options):
+    """Create the chat interface for Q&A
+
+    When stream_response_func is given, answers are rendered token by token.
+    Query embeddings are reused through query_cache, and answers to questions
+    similar to earlier ones about the same document come from answer_cache.
+    With a context_compressor, only the relevant sentences of the retrieved
+    chunks are sent to the LLM; sources are still shown in full.
+    Retrieval is scoped to the session document's namespace, whose last use is
+    recorded in manifest_store to keep it from being garbage-collected. While a
+    new upload is being ingested, questions go to the previously indexed document.
+    With a chunk_store, chat history keeps references to the source chunks
+    rather than copies of them.
+    Extra keyword arguments are forwarded to retrieve_relevant_chunks.
+    """
     st.header("💬 Ask Questions")
     
     # Display chat messages
@@ -205,44 +348,156 @@ def create_chat_interface(groq_client, tokenizer, embedding_model, pinecone_inde
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
 
-            if message["role"] == "assistant" and "highlighted_chunks" in message:
-                with st.expander("View Source Chunks"):
-                    for i, chunk in enumerate(message["highlighted_chunks"]):
-                        st.markdown(f"**Source Chunk {i+1}** (from {chunk['source']}):")
-                        st.text(chunk["text"])
+            if message["role"] == "assistant" and message.get("chunk_refs"):
+                show_source_chunks(message["chunk_refs"], chunk_store, pinecone_index)
+            elif message["role"] == "assistant" and message.get("highlighted_chunks"):
+                show_source_chunks(message["highlighted_chunks"])
+
+            if message["role"] == "assistant" and "latency" in message:
+                st.caption(format_latency(message["latency"]))
     
+    # A new upload only replaces the document being asked about once it is ready
+    if st.session_state.ingestion_job and st.session_state.indexed_document is not None:
+        st.caption(
+            f"⏳ '{st.session_state.document_name}' is still being processed; "
+            f"questions are answered from '{os.path.basename(st.session_state.indexed_document)}' until it is ready."
+        )
+
     # User input
     if user_query := st.chat_input("Ask a question about the document..."):
-        if not st.session_state.document_loaded:
+        if st.session_state.indexed_document is None:
             with st.chat_message("assistant"):
-                st.markdown("⚠️ Please upload a document first before asking questions.")
+                if st.session_state.ingestion_job:
+                    st.markdown("⏳ The document is still being processed. Please ask again once it is ready.")
+                else:
+                    st.markdown("⚠️ Please upload a document first before asking questions.")
         else:
+            namespace = st.session_state.document_namespace
+            # Answers are cached per namespace, so same-named documents never share them
+            cache_key = namespace or st.session_state.indexed_document
+            if manifest_store is not None and namespace and not manifest_store.touch(st.session_state.indexed_document, namespace):
+                # The namespace was garbage-collected while the session was idle
+                st.session_state.document_loaded = False
+                st.session_state.document_name = None
+                st.session_state.document_source = None
+                st.session_state.indexed_document = None
+                st.session_state.document_namespace = None
+                with st.chat_message("assistant"):
+                    st.markdown("⚠️ This document has expired from the index. Please upload it again to keep asking questions.")
+                return
+
             st.session_state.messages.append({"role": "user", "content": user_query})
 
             with st.chat_message("user"):
                 st.markdown(user_query)
             
-            with st.chat_message("assistant"):
-                with st.spinner("Thinking..."):
-                    chunks = retrieve_relevant_chunks(
-                        user_query, pinecone_index, tokenizer, embedding_model
-                    )
-
-                    response = generate_response_func(user_query, chunks, groq_client, llm_model)
+            with st.chat_message("assistant"), tracer.trace("query"):
+                latency = None
+                cached = None
+                if answer_cache is not None:
+                    query_embedding = embed_query(user_query, tokenizer, embedding_model, query_cache)
+                    cached = answer_cache.lookup(cache_key, query_embedding)
 
+                if cached:
+                    response = cached.answer
+                    highlighted_chunks = cached.chunks
                     st.markdown(response)
+                    st.caption(f"⚡ Answered from cache (similarity {cached.similarity:.2f})")
+                else:
+                    if stream_response_func:
+                        with st.spinner("Searching document..."):
+                            chunks = retrieve_relevant_chunks(
+                                user_query, pinecone_index, tokenizer, embedding_model, query_cache=query_cache, namespace=namespace, **retrieval_options
+                            )
+                            prompt_chunks, compression = compress_context(context_compressor, user_query, chunks)
+
+                        stream = stream_response_func(user_query, prompt_chunks, groq_client, llm_model)
+                        st.write_stream(stream)
+                        response = stream.text
+                        succeeded = stream.error is None
+                        latency = {"first_token": stream.time_to_first_token, "total": stream.total_latency}
+                        if stream.prompt_breakdown:
+                            latency["prompt_tokens"] = stream.prompt_breakdown["total"]
+                        if compression:
+                            latency["tokens_saved"] = compression["tokens_saved"]
+                        st.caption(format_latency(latency))
+                    else:
+                        with st.spinner("Thinking..."):
+                            chunks = retrieve_relevant_chunks(
+                                user_query, pinecone_index, tokenizer, embedding_model, query_cache=query_cache, namespace=namespace, **retrieval_options
+                            )
+                            prompt_chunks, _ = compress_context(context_compressor, user_query, chunks)
+
+                            response = generate_response_func(user_query, prompt_chunks, groq_client, llm_model)
+                            succeeded = response != ERROR_RESPONSE
+
+                            st.markdown(response)
 
                     highlighted_chunks = highlight_matching_chunks(response, chunks)
-                    
-                    if highlighted_chunks:
-                        with st.expander("View Source Chunks"):
-                            for i, chunk in enumerate(highlighted_chunks):
-                                st.markdown(f"**Source Chunk {i+1}** (from {chunk['source']}):")
-                                st.text(chunk["text"])
+
+                    # Nothing retrieved is not an answer: the document may be re-indexed with relevant content
+                    if answer_cache is not None and succeeded and chunks and response != NO_CHUNKS_RESPONSE:
+                        answer_cache.store(cache_key, query_embedding, response, highlighted_chunks)
+                
+                if highlighted_chunks:
+                    show_source_chunks(highlighted_chunks)
             
-            # Add assistant message with highlighted chunks to chat history
-            st.session_state.messages.append({
+            # Add assistant message with its source chunks to chat history, as references when possible
+            assistant_message = {
                 "role": "assistant", 
-                "content": response,
-                "highlighted_chunks": highlighted_chunks
-            })
\ No newline at end of file
+                "content": response
+            }
+            if chunk_store is not None:
+                assistant_message["chunk_refs"] = [chunk_store.put(chunk, namespace) for chunk in highlighted_chunks]
+            else:
+                assistant_message["highlighted_chunks"] = highlighted_chunks
+            if latency:
+                assistant_message["latency"] = latency
+            st.session_state.messages.append(assistant_message)
+
+def create_startup_status(components):
+    """Note in the sidebar while background-loaded components are still loading; stop if one failed"""
+    for component in components:
+        error = component.error()
+        if error is not None:
+            st.error(f"Failed to initialize components: {str(error)}")
+            st.stop()
+    if not all(component.ready() for component in components):
+        with st.sidebar:
+            st.caption("⏳ Loading models in the background. The first question or upload may take a little longer.")
+
+def show_trace(trace):
+    """Table of a trace's per-stage timings, given as Trace.to_dict()"""
+    st.markdown(f"**{trace['name']}** took {trace['duration']:.3f}s")
+    rows = []
+    for stage, totals in trace["stages"].items():
+        counts = ", ".join(f"{key}={value:g}" for key, value in totals.items() if key not in ("seconds", "calls"))
+        rows.append({"stage": stage, "ms": round(totals["seconds"] * 1000, 1), "calls": totals["calls"], "counts": counts})
+    untracked = trace["duration"] - sum(totals["seconds"] for totals in trace["stages"].values())
+    rows.append({"stage": "(other)", "ms": round(untracked * 1000, 1), "calls": None, "counts": ""})
+    st.table(rows)
+
+def create_debug_panel(startup_phases=None, ingestion_job=None):
+    """Show the per-stage timing breakdown of the session's last traced request in the sidebar
+
+    startup_phases, a {phase: seconds} mapping, is shown alongside it, as is the
+    trace of ingestion_job, the session's last finished background ingestion,
+    which ran on a worker thread.
+    """
+    trace = tracer.pop_last_trace()
+    if trace is not None:
+        st.session_state.last_trace = trace.to_dict()
+    last_trace = st.session_state.last_trace
+
+    with st.sidebar:
+        if startup_phases:
+            with st.expander("🛠️ Debug: start-up"):
+                st.table([{"phase": phase, "s": round(seconds, 2)} for phase, seconds in startup_phases.items()])
+        if ingestion_job is not None and ingestion_job.trace is not None:
+            with st.expander("🛠️ Debug: last ingestion"):
+                show_trace(ingestion_job.trace.to_dict())
+        with st.expander("🛠️ Debug: last request"):
+            if not last_trace:
+                st.caption("No requests traced yet.")
+                return
+            show_trace(last_trace)
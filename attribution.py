@@ -0,0 +1,117 @@
+import re
+import numpy as np
+from typing import List, Dict
+
+WORD_PATTERN = re.compile(r"\w+")
+SENTENCE_PATTERN = re.compile(r"[^.!?\n]+(?:[.!?]+|$)", re.MULTILINE)
+
+def tokenize(text):
+    """Lowercase word tokens of a text"""
+    return WORD_PATTERN.findall(text.lower())
+
+def split_sentences(text):
+    """Return (start, end) character spans of the sentences in a text"""
+    spans = []
+    for match in SENTENCE_PATTERN.finditer(text):
+        start, end = match.span()
+        # Trim surrounding whitespace so spans point at the sentence itself
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if WORD_PATTERN.search(text, start, end):
+            spans.append((start, end))
+    return spans
+
+def _features(words, min_word_length):
+    """Significant words plus word bigrams, used to match sentences against sources"""
+    features = {w for w in words if len(w) >= min_word_length}
+    features.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+    return features
+
+def _indicator_matrix(feature_sets, vocabulary):
+    matrix = np.zeros((len(feature_sets), len(vocabulary)), dtype=np.float32)
+    for row, features in enumerate(feature_sets):
+        matrix[row, [vocabulary[f] for f in features if f in vocabulary]] = 1.0
+    return matrix
+
+def score_chunks(response: str, chunks: List[Dict], min_word_length=6):
+    """
+    Fraction of each chunk's significant words (at least ``min_word_length`` characters)
+    that appear as whole words in the response, computed for all chunks at once
+    """
+    chunk_words = [{w for w in tokenize(chunk["text"]) if len(w) >= min_word_length} for chunk in chunks]
+    vocabulary = {}
+    for words in chunk_words:
+        for word in words:
+            vocabulary.setdefault(word, len(vocabulary))
+    if not vocabulary:
+        return np.zeros(len(chunks), dtype=np.float32)
+
+    chunk_matrix = _indicator_matrix(chunk_words, vocabulary)
+    response_vector = _indicator_matrix([set(tokenize(response))], vocabulary)[0]
+    totals = chunk_matrix.sum(axis=1)
+    return np.divide(chunk_matrix @ response_vector, totals, out=np.zeros_like(totals), where=totals > 0)
+
+def attribute_chunks(response: str, chunks: List[Dict], threshold=0.2, top_n=3):
+    """
+    Return the chunks whose significant words best cover the response, best first
+    """
+    if not chunks:
+        return []
+    scores = score_chunks(response, chunks)
+    ranked = [i for i in np.argsort(-scores, kind="stable")[:top_n] if scores[i] > threshold]
+    return [{
+        "text": chunks[i]["text"],
+        "source": chunks[i]["source"],
+        "chunk_id": chunks[i]["chunk_id"],
+        "match_score": float(scores[i])
+    } for i in ranked]
+
+def attribute_sentences(response: str, chunks: List[Dict], min_score=0.2, min_word_length=6):
+    """
+    Attribute each response sentence to the chunk sentence it overlaps most with
+
+    Sentences are compared on significant words and word bigrams in a single matrix
+    product over all response and chunk sentences. Returns one dict per attributed
+    response sentence with its span in the response, the matching chunk and the
+    span of the supporting sentence within that chunk's text.
+    """
+    response_spans = split_sentences(response)
+    chunk_spans = [(i, span) for i, chunk in enumerate(chunks) for span in split_sentences(chunk["text"])]
+    if not response_spans or not chunk_spans:
+        return []
+
+    response_features = [_features(tokenize(response[s:e]), min_word_length) for s, e in response_spans]
+    chunk_features = [_features(tokenize(chunks[i]["text"][s:e]), min_word_length) for i, (s, e) in chunk_spans]
+    vocabulary = {}
+    for features in chunk_features:
+        for feature in features:
+            vocabulary.setdefault(feature, len(vocabulary))
+    if not vocabulary:
+        return []
+
+    response_matrix = _indicator_matrix(response_features, vocabulary)
+    overlaps = response_matrix @ _indicator_matrix(chunk_features, vocabulary).T
+    sizes = np.array([max(len(f), 1) for f in response_features], dtype=np.float32)
+    scores = overlaps / sizes[:, None]
+    best = scores.argmax(axis=1)
+
+    attributions = []
+    for row, (start, end) in enumerate(response_spans):
+        score = float(scores[row, best[row]])
+        if score < min_score:
+            continue
+        chunk_index, (chunk_start, chunk_end) = chunk_spans[best[row]]
+        chunk = chunks[chunk_index]
+        attributions.append({
+            "sentence": response[start:end],
+            "start": start,
+            "end": end,
+            "source": chunk["source"],
+            "chunk_id": chunk["chunk_id"],
+            "chunk_start": chunk_start,
+            "chunk_end": chunk_end,
+            "score": score
+        })
+    return attributions
@@ -0,0 +1,252 @@
+"""
+Headless batch Q&A: answer every question in a JSONL file without the Streamlit UI
+
+    python batch_qa.py questions.jsonl --output answers.jsonl
+    python batch_qa.py requests.jsonl --question-field body --id-field request_id --stub-llm
+
+Each input line is a JSON object holding a question (or a bare JSON string).
+All questions are embedded in one batched pass, then retrieval and LLM calls
+run concurrently, capped by ``--concurrency`` and ``--requests-per-minute``.
+Results are written to the output JSONL as soon as each question is answered,
+so they arrive in completion order; ``line`` gives the input line number.
+Configuration is read from the same environment variables as main.py.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+
+from tools import generate_embeddings_batch, retrieve_relevant_chunks, highlight_matching_chunks, index_pdf_document
+from llm import build_messages, request_completion, NO_CHUNKS_RESPONSE, SYSTEM_PROMPT
+from prompt_builder import PromptBuilder, TokenCounter
+from query_cache import QueryEmbeddingCache
+from embedding_backends import EMBEDDING_BACKENDS, load_embedding_model
+from vector_store import LocalVectorStore
+from lexical_index import BM25Index
+from context_compression import ContextCompressor
+
+logger = logging.getLogger(__name__)
+
+def env_flag(name, default):
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+class RateLimiter:
+    """
+    Space calls at least ``60 / requests_per_minute`` seconds apart across threads
+    """
+
+    def __init__(self, requests_per_minute=0):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        time.sleep(start - now)
+
+def read_questions(path, question_field="question", id_field="id"):
+    """
+    Read (line, id, question) triples from a JSONL file, skipping blank lines
+    """
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                questions.append((line_number, line_number, record))
+            else:
+                questions.append((line_number, record.get(id_field, line_number), record[question_field]))
+    return questions
+
+def answer_question(question, groq_client, llm_model, tokenizer, model, index, query_cache, prompt_builder,
+                    rate_limiter, max_retries=3, context_compressor=None, **retrieval_options):
+    """
+    Retrieve, prompt and generate an answer for one question; LLM calls are rate
+    limited and retried with exponential backoff. Returns the result record.
+    """
+    start = time.perf_counter()
+    chunks = retrieve_relevant_chunks(question, index, tokenizer, model, query_cache=query_cache, **retrieval_options)
+    retrieval_seconds = time.perf_counter() - start
+    result = {"question": question, "answer": None, "sources": [], "error": None}
+
+    if not chunks:
+        result["answer"] = NO_CHUNKS_RESPONSE
+    else:
+        prompt_chunks = chunks
+        if context_compressor is not None:
+            prompt_chunks, _ = context_compressor.compress(question, chunks)
+        messages, breakdown = build_messages(question, prompt_chunks, prompt_builder)
+        result["prompt_tokens"] = breakdown["total"]
+        for attempt in range(max_retries + 1):
+            rate_limiter.wait()
+            try:
+                result["answer"] = request_completion(messages, groq_client, llm_model)
+                result["error"] = None
+                break
+            except Exception as e:
+                result["error"] = str(e)
+                if attempt < max_retries:
+                    logger.warning("LLM call failed (attempt %d): %s", attempt + 1, e)
+                    time.sleep(2 ** attempt)
+        if result["answer"] is not None:
+            result["sources"] = [
+                {"source": chunk["source"], "chunk_id": chunk["chunk_id"]}
+                for chunk in highlight_matching_chunks(result["answer"], chunks)
+            ]
+
+    result["latency"] = {"retrieval": retrieval_seconds, "total": time.perf_counter() - start}
+    return result
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("questions", help="JSONL file of questions")
+    parser.add_argument("--output", default="-", help="JSONL results path (default: stdout)")
+    parser.add_argument("--question-field", default="question")
+    parser.add_argument("--id-field", default="id")
+    parser.add_argument("--pdf", nargs="*", default=[], help="PDFs to index before answering")
+    parser.add_argument("--namespace", help="vector store namespace to index into and search (default: the default namespace)")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("BATCH_CONCURRENCY", 8)),
+                        help="questions in flight at once")
+    parser.add_argument("--requests-per-minute", type=float, default=float(os.getenv("BATCH_REQUESTS_PER_MINUTE", 30)),
+                        help="LLM call rate limit (0: unlimited)")
+    parser.add_argument("--max-retries", type=int, default=3, help="retries of a failed LLM call")
+    parser.add_argument("--stub-llm", action="store_true", help="answer with the offline stub LLM instead of Groq")
+    return parser.parse_args()
+
+def load_components(args):
+    """Build the LLM client, embedding model, vector store and retrieval options from the environment"""
+    backend = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unsupported EMBEDDING_BACKEND: {backend}")
+    tokenizer, model = load_embedding_model(
+        os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/all-mpnet-base-v2"),
+        backend,
+        int(os.getenv("EMBEDDING_THREADS", 0)),
+        os.getenv("EMBEDDING_ONNX_DIR", ".cache/onnx")
+    )
+
+    if args.stub_llm:
+        from stubs import StubGroqClient
+        groq_client = StubGroqClient()
+    else:
+        from groq import Groq
+        if not os.getenv("GROQ_API_KEY"):
+            raise ValueError("GROQ_API_KEY environment variable is not set")
+        groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+
+    vector_store_backend = os.getenv("VECTOR_STORE_BACKEND", "pinecone").lower()
+    if vector_store_backend == "local":
+        index = LocalVectorStore(
+            os.getenv("LOCAL_INDEX_PATH", ".cache/local_index"), model.config.hidden_size,
+            dtype=os.getenv("LOCAL_INDEX_DTYPE", "float32")
+        )
+    elif vector_store_backend == "pinecone":
+        import pinecone
+        if not os.getenv("PINECONE_API_KEY"):
+            raise ValueError("PINECONE_API_KEY environment variable is not set")
+        index = pinecone.Pinecone(api_key=os.getenv("PINECONE_API_KEY")).Index(os.getenv("PINECONE_INDEX_NAME", "assessment"))
+    else:
+        raise ValueError(f"Unsupported VECTOR_STORE_BACKEND: {vector_store_backend}")
+
+    lexical_index = None
+    if env_flag("HYBRID_RETRIEVAL", "true"):
+        lexical_index = BM25Index(os.getenv("LEXICAL_INDEX_PATH", ".cache/lexical_index"))
+    retrieval_options = {
+        "top_k": int(os.getenv("RETRIEVAL_TOP_K", 5)),
+        "lexical_index": lexical_index,
+        "dense_top_k": int(os.getenv("DENSE_TOP_K", 20)),
+        "lexical_top_k": int(os.getenv("LEXICAL_TOP_K", 20)),
+        "rrf_k": int(os.getenv("RRF_K", 60)),
+    }
+    return groq_client, tokenizer, model, index, retrieval_options
+
+def main():
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s", stream=sys.stderr)
+    args = parse_args()
+
+    groq_client, tokenizer, model, index, retrieval_options = load_components(args)
+    retrieval_options["namespace"] = args.namespace
+    llm_tokenizer_name = os.getenv("LLM_TOKENIZER", "")
+    llm_tokenizer = None
+    if llm_tokenizer_name:
+        from transformers import AutoTokenizer
+        llm_tokenizer = AutoTokenizer.from_pretrained(llm_tokenizer_name)
+    prompt_builder = PromptBuilder(SYSTEM_PROMPT, TokenCounter(llm_tokenizer), int(os.getenv("LLM_PROMPT_TOKEN_BUDGET", 6000)))
+    batch_size = int(os.getenv("EMBEDDING_BATCH_SIZE", 32))
+
+    for pdf_path in args.pdf:
+        with open(pdf_path, "rb") as pdf_file:
+            chunk_count = index_pdf_document(
+                pdf_file, tokenizer, model, index,
+                int(os.getenv("CHUNK_SIZE", 1000)), int(os.getenv("CHUNK_OVERLAP", 100)),
+                batch_size=batch_size, lexical_index=retrieval_options["lexical_index"], namespace=args.namespace,
+                max_chunk_tokens=int(os.getenv("CHUNK_MAX_TOKENS", 510))
+            )
+        logger.info("Indexed %s into %d chunks", pdf_path, chunk_count)
+
+    questions = read_questions(args.questions, args.question_field, args.id_field)
+    start = time.perf_counter()
+
+    # One batched embedding pass; retrieval then finds every query in the cache
+    texts = list(dict.fromkeys(question for _, _, question in questions))
+    query_cache = QueryEmbeddingCache(max(len(texts), 1))
+    for text, embedding in zip(texts, generate_embeddings_batch(texts, tokenizer, model, batch_size)):
+        query_cache.put(text, embedding)
+    embed_seconds = time.perf_counter() - start
+    logger.info("Embedded %d questions in %.2fs", len(texts), embed_seconds)
+
+    context_compressor = None
+    compression_ratio = float(os.getenv("CONTEXT_COMPRESSION_RATIO", 0.5))
+    if compression_ratio < 1:
+        context_compressor = ContextCompressor(
+            tokenizer, model, compression_ratio, int(os.getenv("CONTEXT_COMPRESSION_NEIGHBORS", 1)),
+            prompt_builder.token_counter, query_cache=query_cache, batch_size=batch_size
+        )
+
+    rate_limiter = RateLimiter(args.requests_per_minute)
+    llm_model = os.getenv("LLM_MODEL", "llama3-70b-8192")
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    failed = 0
+    try:
+        with ThreadPoolExecutor(max_workers=max(args.concurrency, 1)) as executor:
+            futures = {
+                executor.submit(
+                    answer_question, question, groq_client, llm_model, tokenizer, model, index, query_cache,
+                    prompt_builder, rate_limiter, args.max_retries, context_compressor, **retrieval_options
+                ): (line_number, question_id, question)
+                for line_number, question_id, question in questions
+            }
+            for future in as_completed(futures):
+                line_number, question_id, question = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.exception("Question on line %d failed", line_number)
+                    result = {"question": question, "answer": None, "sources": [], "error": str(e)}
+                failed += result["error"] is not None
+                output.write(json.dumps({"line": line_number, "id": question_id, **result}) + "\n")
+                output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    total_seconds = time.perf_counter() - start
+    logger.info("Answered %d questions (%d failed) in %.2fs, %.2f questions/s",
+                len(questions), failed, total_seconds, len(questions) / max(total_seconds, 1e-9))
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,62 @@
+"""
+Compare source attribution against the previous substring word scan on long answers
+
+Run from the repository root:  python benchmarks/attribution_benchmark.py
+"""
+import os
+import sys
+import random
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from attribution import attribute_chunks, attribute_sentences
+
+WORDS = ("experience python machine learning pipeline retrieval embedding developer "
+         "project deployment streamlit vector database transformer analysis skills "
+         "research engineering optimisation framework latency throughput").split()
+
+def legacy_highlight_matching_chunks(response, chunks):
+    """The original per-word substring scan, kept as the benchmark baseline"""
+    highlighted_chunks = []
+    for chunk in chunks:
+        words = set(chunk["text"].lower().split())
+        significant_words = [w for w in words if len(w) > 5]
+        if significant_words:
+            matches = sum(1 for word in significant_words if word in response.lower())
+            match_ratio = matches / len(significant_words)
+            if match_ratio > 0.2:
+                highlighted_chunks.append({
+                    "text": chunk["text"],
+                    "source": chunk["source"],
+                    "chunk_id": chunk["chunk_id"],
+                    "match_score": match_ratio
+                })
+    highlighted_chunks.sort(key=lambda x: x["match_score"], reverse=True)
+    return highlighted_chunks[:3]
+
+def make_text(rng, characters):
+    sentences = []
+    length = 0
+    while length < characters:
+        sentence = " ".join(rng.choice(WORDS) + rng.choice(["", "", str(rng.randint(0, 999))])
+                            for _ in range(rng.randint(8, 20))).capitalize() + "."
+        sentences.append(sentence)
+        length += len(sentence) + 1
+    return " ".join(sentences)
+
+def main():
+    rng = random.Random(0)
+    chunks = [{"text": make_text(rng, 1000), "source": "bench.pdf", "chunk_id": i, "score": 0.5} for i in range(5)]
+
+    print(f"{'answer chars':>12} {'legacy ms':>10} {'chunks ms':>10} {'speedup':>8} {'sentences ms':>13}")
+    for answer_length in (1_000, 4_000, 16_000, 64_000):
+        response = make_text(rng, answer_length)
+        runs = max(3, 200_000 // answer_length)
+        legacy = min(timeit.repeat(lambda: legacy_highlight_matching_chunks(response, chunks), number=runs, repeat=3)) / runs
+        current = min(timeit.repeat(lambda: attribute_chunks(response, chunks), number=runs, repeat=3)) / runs
+        sentences = min(timeit.repeat(lambda: attribute_sentences(response, chunks), number=runs, repeat=3)) / runs
+        print(f"{answer_length:>12} {legacy * 1000:>10.3f} {current * 1000:>10.3f} {legacy / current:>7.1f}x {sentences * 1000:>13.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+Offline end-to-end benchmark of ingestion and question answering
+
+Runs process_pdf_document, retrieve_relevant_chunks, generate_response and
+highlight_matching_chunks outside Streamlit against synthetic PDFs of increasing
+size, a local vector store and a stub Groq client, with configurable latency
+injected into the stand-ins. Batched embeddings are first checked against
+embedding each text on its own. Each document is ingested in a fresh subprocess, so
+its reported peak RSS is that of ingestion alone. Results are printed and
+written as JSON so runs can be compared over time.
+
+Run from the repository root, e.g.:
+    python benchmarks/pipeline_benchmark.py --pages 5 20 80 --random-model
+"""
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import resource
+import tempfile
+import subprocess
+import multiprocessing
+from datetime import datetime, timezone
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from tools import (process_pdf_document, retrieve_relevant_chunks, highlight_matching_chunks,
+                   iter_pdf_pages, iter_document_chunks, generate_embeddings_batch)
+from llm import generate_response
+from vector_store import LocalVectorStore
+from stubs import StubGroqClient, LatencyInjectedIndex
+from embedding_backends import EMBEDDING_BACKENDS, build_embedding_backend, parity_check, batching_parity_check, onnx_model_path
+
+# Streamlit warns about a missing script context on every st.* call outside `streamlit run`
+for name in ("streamlit.runtime.scriptrunner_utils.script_run_context", "streamlit.runtime.state.session_state_proxy"):
+    logging.getLogger(name).setLevel(logging.ERROR)
+
+WORDS = ("experience python machine learning pipeline retrieval embedding developer project "
+         "deployment streamlit vector database transformer analysis skills research engineering "
+         "optimisation framework latency throughput document question answer model training "
+         "evaluation dataset cloud service api backend frontend testing monitoring").split()
+
+def write_synthetic_pdf(path, pages, seed=0, lines_per_page=48, words_per_line=12):
+    """Write a plain-text PDF with ``pages`` pages of pseudo-random prose"""
+    rng = random.Random(seed)
+    page_objects = [4 + 2 * i for i in range(pages)]
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_objects)}] /Count {pages} >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for page_object in page_objects:
+        lines = []
+        for line in range(lines_per_page):
+            if line and line % 8 == 0:
+                lines.append("T*")
+            text = " ".join(rng.choice(WORDS) for _ in range(words_per_line))
+            lines.append(f"({text.capitalize()}.) Tj T*")
+        content = ("BT /F1 10 Tf 14 TL 40 760 Td\n" + "\n".join(lines) + "\nET").encode()
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_object + 1} 0 R >>".encode()
+        )
+        objects.append(f"<< /Length {len(content)} >>\nstream\n".encode() + content + b"\nendstream")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref_offset = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(out)
+
+def load_embedding_model(args):
+    """Load the configured fp32 embedding model, or a small randomly initialised MPNet for offline runs"""
+    import torch
+    if not args.random_model:
+        from transformers import AutoTokenizer, AutoModel
+        return AutoTokenizer.from_pretrained(args.model), AutoModel.from_pretrained(args.model).eval()
+
+    from transformers import MPNetTokenizer, MPNetConfig, MPNetModel
+    vocab_path = os.path.join(tempfile.mkdtemp(), "vocab.txt")
+    with open(vocab_path, "w") as f:
+        f.write("\n".join(["<s>", "<pad>", "</s>", "[UNK]", "<mask>"] + WORDS + list("abcdefghijklmnopqrstuvwxyz.,")))
+    tokenizer = MPNetTokenizer(vocab_path, unk_token="[UNK]")
+    torch.manual_seed(0)
+    config = MPNetConfig(vocab_size=len(tokenizer), hidden_size=args.random_model_dim, num_hidden_layers=4,
+                         num_attention_heads=args.random_model_dim // 64, intermediate_size=4 * args.random_model_dim)
+    return tokenizer, MPNetModel(config).eval()
+
+def percentiles(values):
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    p50, p95, p99 = np.percentile(np.asarray(values) * 1000, [50, 95, 99])
+    return {"p50": round(float(p50), 3), "p95": round(float(p95), 3), "p99": round(float(p99), 3)}
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def load_backend(args):
+    """The embedding backend under test and its fp32 reference model"""
+    tokenizer, reference_model = load_embedding_model(args)
+    onnx_dir = tempfile.mkdtemp() if args.random_model else os.getenv("EMBEDDING_ONNX_DIR", ".cache/onnx")
+    model = build_embedding_backend(reference_model, tokenizer, args.embedding_backend, args.embedding_threads,
+                                    onnx_model_path(onnx_dir, args.model))
+    return tokenizer, reference_model, model
+
+def ingest_document(pdf_path, index_path, args):
+    """
+    Ingest a PDF into a fresh local index; run in its own process, so the peak RSS
+    it returns covers loading the model and streaming this one document only
+    """
+    tokenizer, _, model = load_backend(args)
+    index = LatencyInjectedIndex(
+        LocalVectorStore(index_path, model.config.hidden_size),
+        query_latency=args.vector_latency, upsert_latency=args.vector_latency, delete_latency=args.vector_latency
+    )
+    start = time.perf_counter()
+    with open(pdf_path, "rb") as pdf_file:
+        success, chunk_count = process_pdf_document(
+            pdf_file, tokenizer, model, index, args.chunk_size, args.chunk_overlap,
+            batch_size=args.batch_size, extraction_workers=args.extraction_workers
+        )
+    return success, chunk_count, time.perf_counter() - start, peak_rss_mb()
+
+def benchmark_document(pages, args, tokenizer, model, workdir):
+    pdf_path = os.path.join(workdir, f"synthetic_{pages}p.pdf")
+    write_synthetic_pdf(pdf_path, pages, seed=pages)
+
+    # Full ingestion into a fresh local index, in a subprocess so nothing else counts towards its memory
+    index_path = os.path.join(workdir, f"index_{pages}p")
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        success, chunk_count, ingest_seconds, ingest_peak_rss_mb = pool.apply(ingest_document, (pdf_path, index_path, args))
+    if not success:
+        raise RuntimeError(f"Ingestion of the {pages}-page document failed")
+    index = LatencyInjectedIndex(
+        LocalVectorStore(index_path, model.config.hidden_size),
+        query_latency=args.vector_latency, upsert_latency=args.vector_latency, delete_latency=args.vector_latency
+    )
+
+    # Extraction + splitting on their own
+    start = time.perf_counter()
+    chunks = list(iter_document_chunks(iter_pdf_pages(pdf_path, args.extraction_workers), args.chunk_size, args.chunk_overlap))
+    extract_split_seconds = time.perf_counter() - start
+
+    # Embedding on its own
+    start = time.perf_counter()
+    generate_embeddings_batch([chunk.text for chunk in chunks], tokenizer, model, batch_size=args.batch_size)
+    embed_seconds = time.perf_counter() - start
+
+    # Question answering
+    groq_client = StubGroqClient(args.llm_first_token_latency, args.llm_token_latency)
+    rng = random.Random(pages)
+    stages = {"retrieval": [], "vector_query": [], "llm": [], "highlight": [], "end_to_end": []}
+    for _ in range(args.queries):
+        query = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 10))) + "?"
+        index.timings["query"].clear()
+
+        start = time.perf_counter()
+        retrieved = retrieve_relevant_chunks(query, index, tokenizer, model)
+        retrieved_at = time.perf_counter()
+        response = generate_response(query, retrieved, groq_client, "stub-llm")
+        answered_at = time.perf_counter()
+        highlight_matching_chunks(response, retrieved)
+        finished_at = time.perf_counter()
+
+        stages["retrieval"].append(retrieved_at - start)
+        stages["vector_query"].extend(index.timings["query"])
+        stages["llm"].append(answered_at - retrieved_at)
+        stages["highlight"].append(finished_at - answered_at)
+        stages["end_to_end"].append(finished_at - start)
+
+    return {
+        "pages": pages,
+        "chunks": chunk_count,
+        "extract_split_seconds": round(extract_split_seconds, 4),
+        "embed_seconds": round(embed_seconds, 4),
+        "ingest_seconds": round(ingest_seconds, 4),
+        "chunks_per_second": round(chunk_count / ingest_seconds, 2),
+        "embeddings_per_second": round(len(chunks) / embed_seconds, 2) if embed_seconds else None,
+        "ingest_peak_rss_mb": round(ingest_peak_rss_mb, 1),
+        "query_latency_ms": {stage: percentiles(values) for stage, values in stages.items()},
+    }
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[5, 20, 80], help="page counts of the synthetic PDFs")
+    parser.add_argument("--queries", type=int, default=50, help="questions asked per document")
+    parser.add_argument("--model", default=os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/all-mpnet-base-v2"))
+    parser.add_argument("--random-model", action="store_true", help="use a small random MPNet instead of downloading --model")
+    parser.add_argument("--random-model-dim", type=int, default=384)
+    parser.add_argument("--chunk-size", type=int, default=int(os.getenv("CHUNK_SIZE", 1000)))
+    parser.add_argument("--chunk-overlap", type=int, default=int(os.getenv("CHUNK_OVERLAP", 100)))
+    parser.add_argument("--embedding-backend", choices=EMBEDDING_BACKENDS, default=os.getenv("EMBEDDING_BACKEND", "torch"))
+    parser.add_argument("--embedding-threads", type=int, default=int(os.getenv("EMBEDDING_THREADS", 0)),
+                        help="intra-op threads (0: match the CPU quota)")
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("EMBEDDING_BATCH_SIZE", 32)))
+    parser.add_argument("--batching-tolerance", type=float, default=1e-5,
+                        help="largest allowed difference between batched and per-text fp32 embeddings")
+    parser.add_argument("--extraction-workers", type=int, default=1)
+    parser.add_argument("--vector-latency", type=float, default=0.0, help="seconds added to every vector store call")
+    parser.add_argument("--llm-first-token-latency", type=float, default=0.2)
+    parser.add_argument("--llm-token-latency", type=float, default=0.0)
+    parser.add_argument("--output", help="JSON results path (default: benchmarks/results/pipeline-<timestamp>.json)")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    tokenizer, reference_model, model = load_backend(args)
+    batching_diff = batching_parity_check(tokenizer, reference_model)
+    print(f"batched vs per-text embeddings: max abs diff {batching_diff:.2e}")
+    if batching_diff > args.batching_tolerance:
+        raise RuntimeError(f"Batched embeddings differ from per-text embeddings by {batching_diff:.2e} (tolerance {args.batching_tolerance})")
+    parity = parity_check(tokenizer, reference_model, model) if model is not reference_model else None
+    if parity:
+        print(f"{args.embedding_backend} parity against fp32: {parity}")
+
+    started = datetime.now(timezone.utc)
+    documents = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for pages in args.pages:
+            result = benchmark_document(pages, args, tokenizer, model, workdir)
+            documents.append(result)
+            latency = result["query_latency_ms"]
+            print(f"{pages:>4} pages  {result['chunks']:>5} chunks  "
+                  f"{result['chunks_per_second']:>8.1f} chunks/s  {result['embeddings_per_second']:>8.1f} emb/s  "
+                  f"ingest rss {result['ingest_peak_rss_mb']:>7.1f} MB  "
+                  f"retrieval p50/p95/p99 {latency['retrieval']['p50']}/{latency['retrieval']['p95']}/{latency['retrieval']['p99']} ms  "
+                  f"end-to-end p50 {latency['end_to_end']['p50']} ms")
+
+    results = {
+        "timestamp": started.isoformat(),
+        "git_commit": git_commit(),
+        "config": vars(args),
+        "embedding_parity": parity,
+        "batching_max_abs_diff": batching_diff,
+        "documents": documents,
+    }
+    output = args.output or os.path.join(ROOT, "benchmarks", "results", f"pipeline-{started:%Y%m%dT%H%M%SZ}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+if __name__ == "__main__":
+    main()
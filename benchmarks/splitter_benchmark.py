@@ -0,0 +1,97 @@
+"""
+Compare the streaming text splitter against LangChain's RecursiveCharacterTextSplitter on large documents
+
+Run from the repository root:  python benchmarks/splitter_benchmark.py [--tokenizer sentence-transformers/all-mpnet-base-v2]
+
+LangChain is only needed for the comparison columns; without it only the
+streaming splitter is timed. With --tokenizer, the token-limited split is timed too.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from text_splitter import StreamingTextSplitter
+
+WORDS = ("experience python machine learning pipeline retrieval embedding developer "
+         "project deployment streamlit vector database transformer analysis skills "
+         "research engineering optimisation framework latency throughput").split()
+
+def make_page(rng, characters):
+    """Paragraphs of lines of words, like text extracted from a PDF page"""
+    paragraphs = []
+    length = 0
+    while length < characters:
+        lines = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 15))) for _ in range(rng.randint(1, 8))]
+        paragraphs.append("\n".join(lines))
+        length += len(paragraphs[-1]) + 2
+    return "\n\n".join(paragraphs)
+
+def check_overlap(splitter, length=4500):
+    """Hard cuts through an unbroken run of characters must keep the overlap"""
+    chunks = splitter.split_text("x" * length)
+    for previous, chunk in zip(chunks, chunks[1:]):
+        if chunk.start != max(previous.end - splitter.chunk_overlap, previous.start + 1):
+            raise RuntimeError(f"Chunks ({previous.start}, {previous.end}) and ({chunk.start}, {chunk.end}) do not overlap by {splitter.chunk_overlap}")
+    if chunks[-1].end != length:
+        raise RuntimeError(f"The last chunk ends at {chunks[-1].end}, not {length}")
+
+def best_of(function, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--page-chars", type=int, default=3000)
+    parser.add_argument("--chunk-size", type=int, default=int(os.getenv("CHUNK_SIZE", 1000)))
+    parser.add_argument("--chunk-overlap", type=int, default=int(os.getenv("CHUNK_OVERLAP", 100)))
+    parser.add_argument("--tokenizer", help="embedding tokenizer to also time the token-limited split with")
+    parser.add_argument("--max-tokens", type=int, default=int(os.getenv("CHUNK_MAX_TOKENS", 510)))
+    args = parser.parse_args()
+
+    try:
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+        langchain_splitter = RecursiveCharacterTextSplitter(chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap)
+    except ImportError:
+        print("langchain is not installed, only timing the streaming splitter")
+        langchain_splitter = None
+    splitter = StreamingTextSplitter(args.chunk_size, args.chunk_overlap)
+    check_overlap(splitter)
+    token_splitter = None
+    if args.tokenizer:
+        from transformers import AutoTokenizer
+        token_splitter = StreamingTextSplitter(
+            args.chunk_size, args.chunk_overlap, tokenizer=AutoTokenizer.from_pretrained(args.tokenizer), max_tokens=args.max_tokens
+        )
+
+    rng = random.Random(0)
+    print(f"{'pages':>6} {'MB':>6} {'chunks':>7} {'stream s':>9} {'MB/s':>7} "
+          f"{'langchain s':>12} {'lc chunks':>10} {'speedup':>8} {'tokens s':>9}")
+    for page_count in args.pages:
+        pages = [(number, make_page(rng, args.page_chars)) for number in range(1, page_count + 1)]
+        megabytes = sum(len(text) + 1 for _, text in pages) / 1e6
+
+        stream_seconds, chunks = best_of(lambda: list(splitter.split_pages(pages)))
+        row = f"{page_count:>6} {megabytes:>6.1f} {len(chunks):>7} {stream_seconds:>9.3f} {megabytes / stream_seconds:>7.1f}"
+        if langchain_splitter is not None:
+            # LangChain needs the whole document in memory at once
+            document = "".join(text + "\n" for _, text in pages)
+            langchain_seconds, langchain_chunks = best_of(lambda: langchain_splitter.split_text(document))
+            row += f" {langchain_seconds:>12.3f} {len(langchain_chunks):>10} {langchain_seconds / stream_seconds:>7.1f}x"
+        else:
+            row += f" {'-':>12} {'-':>10} {'-':>8}"
+        if token_splitter is not None:
+            token_seconds, _ = best_of(lambda: list(token_splitter.split_pages(pages)), repeat=1)
+            row += f" {token_seconds:>9.3f}"
+        print(row)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import logging
+import numpy as np
+from typing import List, Dict
+from attribution import split_sentences
+from prompt_builder import TokenCounter
+from tools import embed_chunks, embed_query
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+class ContextCompressor:
+    """
+    Shrink retrieved chunks to the sentences most relevant to the query
+
+    All sentences of all chunks are embedded in one batch with the embedding model
+    and ranked by cosine similarity to the query. The best sentences, each with
+    ``context_sentences`` neighbours on either side, are kept until ``ratio`` of
+    the original text is used. Kept sentences stay in document order; gaps are
+    marked with an ellipsis and chunks left without sentences are dropped.
+    """
+
+    def __init__(self, tokenizer, model, ratio=0.5, context_sentences=1, token_counter=None,
+                 embedding_cache=None, query_cache=None, batch_size=32):
+        self.tokenizer = tokenizer
+        self.model = model
+        self.ratio = ratio
+        self.context_sentences = context_sentences
+        self.token_counter = token_counter or TokenCounter()
+        self.embedding_cache = embedding_cache
+        self.query_cache = query_cache
+        self.batch_size = batch_size
+
+    def _select(self, spans, scores, budget):
+        """Indices of the sentences to keep, given (chunk, start, end) spans and their scores"""
+        kept = set()
+        used = 0
+        for i in np.argsort(-scores, kind="stable").tolist():
+            if i in kept:
+                continue
+            chunk_index = spans[i][0]
+            group = [j for j in range(i - self.context_sentences, i + self.context_sentences + 1)
+                     if 0 <= j < len(spans) and spans[j][0] == chunk_index and j not in kept]
+            cost = sum(spans[j][2] - spans[j][1] for j in group)
+            if used + cost > budget:
+                # Fall back to the sentence alone, without its neighbours
+                group = [i]
+                cost = spans[i][2] - spans[i][1]
+                if kept and used + cost > budget:
+                    continue
+            kept.update(group)
+            used += cost
+            if used >= budget:
+                break
+        return kept
+
+    def compress(self, query: str, chunks: List[Dict]):
+        """
+        Return (compressed_chunks, report) where the report gives the prompt tokens
+        of the chunks before and after compression and the sentences kept
+        """
+        spans = [(c, start, end) for c, chunk in enumerate(chunks) for start, end in split_sentences(chunk["text"])]
+        original_tokens = sum(self.token_counter.count(chunk["text"]) for chunk in chunks)
+        report = {
+            "original_tokens": original_tokens,
+            "compressed_tokens": original_tokens,
+            "tokens_saved": 0,
+            "sentences_total": len(spans),
+            "sentences_kept": len(spans),
+        }
+        if len(spans) < 2 or self.ratio >= 1:
+            return chunks, report
+
+        with tracer.span("compress", sentences=len(spans)) as span:
+            sentences = [chunks[c]["text"][start:end] for c, start, end in spans]
+            sentence_embeddings = embed_chunks(sentences, self.tokenizer, self.model, self.batch_size, self.embedding_cache)
+            query_embedding = embed_query(query, self.tokenizer, self.model, self.query_cache)
+            scores = sentence_embeddings @ query_embedding / (
+                np.linalg.norm(sentence_embeddings, axis=1) * np.linalg.norm(query_embedding) + 1e-12
+            )
+
+            budget = self.ratio * sum(end - start for _, start, end in spans)
+            kept = self._select(spans, scores, budget)
+
+            compressed = []
+            for c, chunk in enumerate(chunks):
+                rows = [i for i in sorted(kept) if spans[i][0] == c]
+                if not rows:
+                    continue
+                # Contiguous runs of kept sentences are copied verbatim, gaps become an ellipsis
+                runs = [[rows[0]]]
+                for i in rows[1:]:
+                    if i == runs[-1][-1] + 1:
+                        runs[-1].append(i)
+                    else:
+                        runs.append([i])
+                text = " … ".join(chunk["text"][spans[run[0]][1]:spans[run[-1]][2]] for run in runs)
+                compressed.append({**chunk, "text": text})
+
+            report["compressed_tokens"] = sum(self.token_counter.count(chunk["text"]) for chunk in compressed)
+            report["tokens_saved"] = original_tokens - report["compressed_tokens"]
+            report["sentences_kept"] = len(kept)
+            span.set(tokens_saved=report["tokens_saved"])
+
+        logger.info("Context compression: %s", report)
+        return compressed, report
@@ -0,0 +1,150 @@
+import os
+import hashlib
+import tempfile
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+from index_manifest import chunk_digest, chunk_vector_id
+
+logger = logging.getLogger(__name__)
+
+# Identifies a chunk in the index: its document namespace ("" for the default
+# one), its source document, its chunk number within the document and the
+# content hash of its text, which tells apart same-named documents
+ChunkRef = namedtuple("ChunkRef", ["namespace", "source", "chunk_id", "digest"])
+
+class ChunkStore:
+    """
+    In-process LRU store of chunk texts shared by all sessions
+
+    Chat history keeps ChunkRefs instead of copies of its source chunks, so a
+    session's memory no longer grows with the length of the chunks it cites.
+    Beyond ``max_chunks`` the least recently used chunks are evicted; they are
+    then read back from the vector store's metadata when still indexed unchanged.
+    """
+
+    def __init__(self, max_chunks=10000):
+        self.max_chunks = max_chunks
+        self._chunks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, chunk, namespace=None):
+        """
+        Store a chunk given as a ``{"text", "source", "chunk_id"}`` dict and return its ChunkRef
+        """
+        ref = ChunkRef(namespace or "", chunk["source"], chunk["chunk_id"], chunk_digest(chunk["text"]))
+        with self._lock:
+            self._chunks[ref] = chunk["text"]
+            self._chunks.move_to_end(ref)
+            while len(self._chunks) > self.max_chunks:
+                self._chunks.popitem(last=False)
+        return ref
+
+    def get(self, ref, index=None):
+        """
+        Return the chunk text for a ChunkRef; once evicted, it is fetched from
+        ``index`` if given and the chunk there is unchanged, otherwise None
+        """
+        with self._lock:
+            text = self._chunks.get(ref)
+            if text is not None:
+                self._chunks.move_to_end(ref)
+                return text
+        if index is None:
+            return None
+
+        vector_id = chunk_vector_id(ref.source, ref.chunk_id)
+        try:
+            vector = index.fetch(ids=[vector_id], namespace=ref.namespace or None).vectors.get(vector_id)
+        except Exception as e:
+            logger.warning("Could not fetch chunk %s: %s", vector_id, e)
+            return None
+        text = vector.metadata.get("text") if vector is not None and vector.metadata else None
+        if text is None or chunk_digest(text) != ref.digest:
+            # Re-indexed (or replaced by a same-named document) since it was cited
+            return None
+        self.put({"text": text, "source": ref.source, "chunk_id": ref.chunk_id}, ref.namespace)
+        return text
+
+    def __len__(self):
+        return len(self._chunks)
+
+class FileStore:
+    """
+    Content-addressed store of uploaded files on local disk
+
+    Each file is written once, as ``<sha256>.pdf``, however often and under
+    whatever name it is uploaded. Files are touched when read or served, and
+    beyond ``max_size_mb`` the least recently used ones are deleted.
+    """
+
+    def __init__(self, directory, max_size_mb=512, suffix=".pdf"):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+        self.suffix = suffix
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest(data):
+        return hashlib.sha256(data).hexdigest()
+
+    def path(self, digest):
+        return os.path.join(self.directory, digest + self.suffix)
+
+    def put(self, data, digest=None):
+        """
+        Store file contents unless already present and return their digest
+        (the sha256 hex digest of ``data``, which can be passed in if already known)
+        """
+        digest = digest or self.digest(data)
+        path = self.path(digest)
+        with self._lock:
+            if os.path.exists(path):
+                os.utime(path)
+                return digest
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            self._evict(keep=path)
+        return digest
+
+    def read(self, digest):
+        """
+        Return the contents of a stored file; raises FileNotFoundError once it has been evicted
+        """
+        path = self.path(digest)
+        with open(path, "rb") as f:
+            data = f.read()
+        os.utime(path)
+        return data
+
+    def touch(self, digest):
+        """
+        Mark a stored file as recently used, e.g. when serving a cached copy of it;
+        returns False if it has been evicted
+        """
+        try:
+            os.utime(self.path(digest))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def _evict(self, keep):
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(self.suffix):
+                stat = os.stat(os.path.join(self.directory, name))
+                files.append((stat.st_mtime, stat.st_size, os.path.join(self.directory, name)))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if path != keep:
+                os.remove(path)
+                total -= size
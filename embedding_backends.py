@@ -0,0 +1,246 @@
+import os
+import re
+import math
+import logging
+import importlib.util
+import numpy as np
+from tools import generate_embeddings_batch, mean_pooling
+
+logger = logging.getLogger(__name__)
+
+# torch and transformers are imported inside the functions below so that
+# EMBEDDING_BACKENDS can be read without paying for them
+
+EMBEDDING_BACKENDS = ("torch", "quantized", "onnx", "onnx-int8")
+ONNX_OPSET = 17
+
+# Sentences embedded by both the fp32 model and the selected backend to measure drift
+PARITY_TEXTS = [
+    "Experienced machine learning engineer with a background in natural language processing.",
+    "Built retrieval-augmented generation pipelines using vector databases and transformer models.",
+    "Education: Bachelor of Engineering in Computer Science, 2019 - 2023.",
+    "Skills: Python, PyTorch, SQL, Docker, Streamlit, REST APIs.",
+    "Led a team of four developers to deliver a document search product on time.",
+    "What programming languages does the candidate know?",
+]
+
+def available_cpus():
+    """
+    Number of CPUs this process can actually use: the container's cgroup CPU quota
+    if one is set, otherwise the CPUs in the process's affinity mask
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    quota = None
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            limit, period = f.read().split()
+        if limit != "max":
+            quota = int(limit) / int(period)
+    except (OSError, ValueError):
+        try:
+            # cgroup v1: a quota of -1 means unlimited
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+                limit = int(f.read())
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+                period = int(f.read())
+            if limit > 0:
+                quota = limit / period
+        except (OSError, ValueError):
+            pass
+
+    if quota:
+        cpus = min(cpus, max(1, math.floor(quota)))
+    return cpus
+
+class OnnxEmbeddingModel:
+    """
+    ONNX Runtime session exposing the call signature of a Hugging Face model
+
+    Called with the tokenizer's tensors, it returns a tuple whose first item is the
+    last hidden state, so it can stand in for the PyTorch model in mean pooling.
+    """
+
+    def __init__(self, path, config, num_threads):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("The onnx embedding backends require onnxruntime: pip install -r requirements-onnx.txt") from e
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {node.name for node in self.session.get_inputs()}
+        self.config = config
+
+    def __call__(self, **inputs):
+        import torch
+
+        feed = {name: tensor.numpy() for name, tensor in inputs.items() if name in self.input_names}
+        last_hidden_state = self.session.run(["last_hidden_state"], feed)[0]
+        return (torch.from_numpy(last_hidden_state),)
+
+def onnx_model_path(cache_dir, model_name):
+    """Location of the exported graph; the transformers version is part of the key"""
+    import transformers
+
+    safe_name = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+    return os.path.join(cache_dir, f"{safe_name}-transformers{transformers.__version__}-opset{ONNX_OPSET}.onnx")
+
+def export_onnx(model, tokenizer, path):
+    """
+    Export a Hugging Face encoder to ONNX with dynamic batch and sequence axes
+    """
+    import torch
+
+    class _LastHiddenState(torch.nn.Module):
+        """Positional-argument wrapper returning only the last hidden state"""
+
+        def __init__(self, model, input_names):
+            super().__init__()
+            self.model = model
+            self.input_names = input_names
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(self.input_names, inputs)))[0]
+
+    # A padded batch, so the attention-mask path is traced with real padding
+    sample = tokenizer(["Exporting the embedding model.", "Export"], padding=True, return_tensors="pt")
+    input_names = [name for name in tokenizer.model_input_names if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]}
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with torch.inference_mode():
+        torch.onnx.export(
+            _LastHiddenState(model, input_names).eval(),
+            tuple(sample[name] for name in input_names),
+            tmp_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=ONNX_OPSET,
+            dynamo=False
+        )
+    # Rename into place so a concurrent reader never sees a partial file
+    os.replace(tmp_path, path)
+    return path
+
+def quantize_onnx(path, quantized_path):
+    """
+    Write a copy of an exported graph with weights dynamically quantized to int8
+    """
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    tmp_path = f"{quantized_path}.{os.getpid()}.tmp"
+    quantize_dynamic(path, tmp_path, weight_type=QuantType.QInt8)
+    os.replace(tmp_path, quantized_path)
+    return quantized_path
+
+def require_onnx(backend):
+    """
+    Raise an ImportError naming the missing packages when an onnx backend is
+    selected without the optional requirements-onnx.txt installed
+    """
+    missing = [name for name in ("onnx", "onnxruntime") if importlib.util.find_spec(name) is None]
+    if missing:
+        raise ImportError(
+            f"The {backend} embedding backend requires {' and '.join(missing)}: pip install -r requirements-onnx.txt"
+        )
+
+def build_embedding_backend(model, tokenizer, backend="torch", num_threads=0, onnx_path=None):
+    """
+    Convert an fp32 PyTorch embedding model to the selected backend
+
+    Args:
+        model: fp32 Hugging Face model in eval mode
+        tokenizer: The model's tokenizer
+        backend: "torch" (unchanged), "quantized" (dynamic int8 Linear layers),
+            "onnx" (ONNX Runtime session over a cached export) or "onnx-int8"
+            (the same with int8 weights)
+        num_threads: Intra-op threads; 0 matches the container's CPU quota
+        onnx_path: Where the exported graph is cached (required for the onnx backends)
+
+    Returns:
+        A model callable like the original, with the same ``config``
+    """
+    import torch
+
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unsupported embedding backend: {backend}")
+    num_threads = num_threads or available_cpus()
+    torch.set_num_threads(num_threads)
+
+    if backend == "quantized":
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if backend in ("onnx", "onnx-int8"):
+        require_onnx(backend)
+        if not os.path.exists(onnx_path):
+            logger.info("Exporting embedding model to %s", onnx_path)
+            export_onnx(model, tokenizer, onnx_path)
+        if backend == "onnx-int8":
+            quantized_path = onnx_path[:-len(".onnx")] + "-int8.onnx"
+            if not os.path.exists(quantized_path):
+                quantize_onnx(onnx_path, quantized_path)
+            onnx_path = quantized_path
+        return OnnxEmbeddingModel(onnx_path, model.config, num_threads)
+    return model
+
+def parity_check(tokenizer, reference_model, model, texts=PARITY_TEXTS):
+    """
+    Cosine similarity between reference (fp32) and backend embeddings of the same texts
+    """
+    reference = generate_embeddings_batch(texts, tokenizer, reference_model)
+    candidate = generate_embeddings_batch(texts, tokenizer, model)
+    cosines = np.sum(reference * candidate, axis=1) / (
+        np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1)
+    )
+    return {
+        "min_cosine": float(cosines.min()),
+        "mean_cosine": float(cosines.mean()),
+        "max_abs_diff": float(np.abs(reference - candidate).max()),
+    }
+
+def batching_parity_check(tokenizer, model, texts=PARITY_TEXTS, batch_size=4):
+    """
+    Largest absolute difference between the length-sorted, padded batches of
+    generate_embeddings_batch and mean pooling each text on its own
+    """
+    import torch
+
+    # Mixed lengths, so most batches are padded
+    texts = list(texts) + [" ".join(texts)]
+    batched = generate_embeddings_batch(texts, tokenizer, model, batch_size=batch_size)
+    with torch.inference_mode():
+        single = np.stack([
+            mean_pooling(model(**encoded), encoded["attention_mask"])[0].numpy()
+            for encoded in (tokenizer(text, truncation=True, max_length=512, return_tensors="pt") for text in texts)
+        ])
+    return float(np.abs(batched - single).max())
+
+def load_embedding_model(model_name, backend="torch", num_threads=0, onnx_dir=".cache/onnx", check_parity=False):
+    """
+    Load the tokenizer and embedding model for the selected backend
+
+    With ``check_parity``, the backend's embeddings are compared against the fp32
+    model's and the cosine drift is logged (as a warning below 0.99).
+    """
+    from transformers import AutoTokenizer, AutoModel
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    reference_model = AutoModel.from_pretrained(model_name).eval()
+    model = build_embedding_backend(
+        reference_model, tokenizer, backend, num_threads, onnx_model_path(onnx_dir, model_name)
+    )
+
+    if check_parity and model is not reference_model:
+        report = parity_check(tokenizer, reference_model, model)
+        log = logger.warning if report["min_cosine"] < 0.99 else logger.info
+        log("Embedding backend %s parity against fp32: %s", backend, report)
+    return tokenizer, model
@@ -0,0 +1,125 @@
+import os
+import hashlib
+import sqlite3
+import threading
+import time
+import numpy as np
+from typing import List, Tuple
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed cache of chunk embeddings
+
+    Entries are keyed by (model name, chunk size, chunk overlap, sha256 of the chunk
+    text) and stored as raw float32 blobs in a SQLite file. When the stored vectors
+    exceed ``max_size_mb`` the least recently used entries are evicted.
+    """
+
+    def __init__(self, path, model_name, chunk_size, chunk_overlap, max_size_mb=256):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.namespace = f"{model_name}:{chunk_size}:{chunk_overlap}"
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "namespace TEXT NOT NULL, digest BLOB NOT NULL, vector BLOB NOT NULL, "
+            "last_used REAL NOT NULL, PRIMARY KEY (namespace, digest))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_lru ON embeddings (last_used)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def _digest(text):
+        return hashlib.sha256(text.encode("utf-8")).digest()
+
+    def get_many(self, texts: List[str]) -> Tuple[List, List[int]]:
+        """
+        Look up embeddings for ``texts``
+
+        Returns a list with a float32 vector (or None) per text and the indices of the
+        texts that were not found.
+        """
+        digests = [self._digest(text) for text in texts]
+        found = {}
+        with self._lock:
+            for start in range(0, len(digests), 500):
+                batch = digests[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT digest, vector FROM embeddings WHERE namespace = ? "
+                    f"AND digest IN ({','.join('?' * len(batch))})",
+                    [self.namespace, *batch]
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE namespace = ? AND digest = ?",
+                    [(now, self.namespace, digest) for digest in found]
+                )
+                self._conn.commit()
+
+            results, missing = [], []
+            for i, digest in enumerate(digests):
+                blob = found.get(digest)
+                if blob is None:
+                    results.append(None)
+                    missing.append(i)
+                else:
+                    results.append(np.frombuffer(blob, dtype=np.float32))
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        return results, missing
+
+    def put_many(self, texts: List[str], embeddings: np.ndarray):
+        """
+        Store embeddings for ``texts`` and evict least recently used entries if needed
+        """
+        if not len(texts):
+            return
+        now = time.time()
+        rows = [
+            (self.namespace, self._digest(text), np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for text, vector in zip(texts, embeddings)
+        ]
+        with self._lock:
+            for namespace, digest, blob, _ in rows:
+                previous = self._conn.execute(
+                    "SELECT LENGTH(vector) FROM embeddings WHERE namespace = ? AND digest = ?",
+                    (namespace, digest)
+                ).fetchone()
+                self._size += len(blob) - (previous[0] if previous else 0)
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        while self._size > self.max_bytes:
+            victims = self._conn.execute(
+                "SELECT namespace, digest, LENGTH(vector) FROM embeddings ORDER BY last_used LIMIT 256"
+            ).fetchall()
+            if not victims:
+                self._size = 0
+                return
+            for namespace, digest, size in victims:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE namespace = ? AND digest = ?", (namespace, digest)
+                )
+                self._size -= size
+                if self._size <= self.max_bytes:
+                    break
+
+    def stats(self):
+        """
+        Return hit/miss counters and the current on-disk payload size
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size_bytes": self._size,
+        }
@@ -0,0 +1,130 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+from typing import Dict
+
+def chunk_digest(text):
+    """Content hash used to detect changed chunks"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def chunk_vector_id(document_name, chunk_id):
+    """Id a document's chunk is stored under in the vector store and lexical index"""
+    return f"{document_name}_chunk_{chunk_id}"
+
+def document_digest(data):
+    """Content hash of a document's bytes"""
+    return hashlib.sha256(data).hexdigest()
+
+def document_namespace(data=None, digest=None):
+    """
+    Vector store namespace of a document, derived from its bytes (or their
+    document_digest, if already known) so that only sessions holding the same
+    file share it
+    """
+    return "doc-" + (digest or document_digest(data))[:32]
+
+class ManifestStore:
+    """
+    Per-document manifests of the chunks currently written to a vector index
+
+    Each manifest maps vector ids to the content hash of the chunk stored under that
+    id, which lets re-indexing embed and write only changed chunks and delete the
+    ones that disappeared. Manifests are JSON files replaced atomically on save and
+    are scoped to an index and embedding model (including its backend), so
+    switching either starts fresh.
+    A document indexed into a namespace has its own manifest per namespace; the
+    file's modification time records when the namespace was last used, which is
+    what namespace garbage collection goes by.
+    """
+
+    def __init__(self, directory, index_name, model_name):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.index_name = index_name
+        self.model_name = model_name
+
+    def _path(self, document_name, namespace=None):
+        key = f"{self.index_name}\0{document_name}"
+        if namespace:
+            key = f"{self.index_name}\0{namespace}\0{document_name}"
+        key = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{key[:32]}.json")
+
+    def load(self, document_name, namespace=None) -> Dict[str, str]:
+        """
+        Return the {vector id: chunk hash} mapping last saved for a document
+        """
+        try:
+            with open(self._path(document_name, namespace), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        if (manifest.get("model") != self.model_name or manifest.get("document") != document_name
+                or manifest.get("namespace") != namespace):
+            return {}
+        return manifest.get("chunks", {})
+
+    def touch(self, document_name, namespace=None):
+        """
+        Mark a document's namespace as in use, postponing its garbage collection;
+        returns False if the document has no manifest (e.g. it was collected)
+        """
+        try:
+            os.utime(self._path(document_name, namespace))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def expired_namespaces(self, ttl_seconds):
+        """
+        Namespaces of this index none of whose documents were used in the last ``ttl_seconds``
+        """
+        last_used = {}
+        for manifest, path in self._namespaced_manifests():
+            namespace = manifest["namespace"]
+            last_used[namespace] = max(last_used.get(namespace, 0), os.path.getmtime(path))
+        cutoff = time.time() - ttl_seconds
+        return [namespace for namespace, used in last_used.items() if used < cutoff]
+
+    def remove_namespace(self, namespace):
+        """
+        Delete the manifests of every document in a namespace
+        """
+        for manifest, path in self._namespaced_manifests():
+            if manifest["namespace"] == namespace:
+                os.unlink(path)
+
+    def _namespaced_manifests(self):
+        for file_name in os.listdir(self.directory):
+            if not file_name.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, file_name)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    manifest = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                continue
+            if manifest.get("index") == self.index_name and manifest.get("namespace"):
+                yield manifest, path
+
+    def save(self, document_name, chunks: Dict[str, str], namespace=None):
+        """
+        Atomically replace a document's manifest
+        """
+        manifest = {
+            "document": document_name,
+            "index": self.index_name,
+            "model": self.model_name,
+            "namespace": namespace,
+            "chunks": chunks,
+        }
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+            os.replace(tmp_path, self._path(document_name, namespace))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
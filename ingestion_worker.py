@@ -0,0 +1,141 @@
+import io
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+class IngestionJob:
+    """
+    Progress and outcome of indexing one uploaded document in the background
+
+    ``status`` goes from "queued" to "running" to "done" or "failed". ``progress``
+    counts pages extracted, chunks split and embedded and vectors written;
+    ``total_pages`` is reported by the indexing function once it has opened the PDF.
+    ``trace`` holds the job's "ingest" trace once finished, if tracing is enabled.
+    """
+
+    def __init__(self, job_id, document_name, data, namespace=None):
+        self.id = job_id
+        self.document_name = document_name
+        self.namespace = namespace
+        self.size = len(data)
+        self.status = "queued"
+        self.total_pages = None
+        self.progress = {"pages": 0, "chunks": 0, "embedded": 0, "vectors": 0, "deleted": 0}
+        self.chunk_count = 0
+        self.error = None
+        self.trace = None
+        self.submitted_at = time.time()
+        self.finished_at = None
+        self._data = data
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+    def advance(self, stage, count):
+        with self._lock:
+            if stage == "total_pages":
+                self.total_pages = count
+            else:
+                self.progress[stage] = self.progress.get(stage, 0) + count
+
+    def snapshot(self):
+        """A consistent copy of the job's state for display"""
+        with self._lock:
+            return {
+                "id": self.id,
+                "document_name": self.document_name,
+                "status": self.status,
+                "total_pages": self.total_pages,
+                "progress": dict(self.progress),
+                "chunk_count": self.chunk_count,
+                "error": self.error,
+            }
+
+class IngestionWorker:
+    """
+    Background pool that indexes uploaded PDFs, shared by all sessions
+
+    Jobs are keyed by the sha256 of the file's bytes: submitting a file that is
+    already queued, running or indexed returns the existing job instead of
+    indexing it again, so concurrent uploads of the same PDF share one job and
+    Streamlit reruns never re-trigger ingestion. Failed jobs are retried on the
+    next submit. ``index_func`` is called as
+    ``index_func(pdf_file, *args, progress=job.advance, **kwargs)`` and returns
+    the number of chunks indexed.
+    """
+
+    def __init__(self, index_func, max_workers=1, max_finished_jobs=100):
+        self.index_func = index_func
+        self.max_finished_jobs = max_finished_jobs
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+
+    def submit(self, data, document_name, *args, job_id=None, **kwargs):
+        """
+        Queue a PDF, given as bytes, for indexing and return its IngestionJob;
+        ``job_id`` is the sha256 hex digest of the bytes, if already known
+        """
+        job_id = job_id or hashlib.sha256(data).hexdigest()
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is not None and job.status != "failed":
+                return job
+            job = IngestionJob(job_id, document_name, data, kwargs.get("namespace"))
+            self.jobs[job_id] = job
+            self._prune()
+        self._executor.submit(self._run, job, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def forget(self, job_id):
+        """
+        Drop a finished job, so its file is indexed again when next submitted
+        (e.g. after its namespace has been garbage-collected)
+        """
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is not None and job.finished:
+                del self.jobs[job_id]
+
+    def forget_namespace(self, namespace):
+        """Drop the finished jobs that indexed into ``namespace``"""
+        with self._lock:
+            for job in list(self.jobs.values()):
+                if job.namespace == namespace and job.finished:
+                    del self.jobs[job.id]
+
+    def _prune(self):
+        finished = sorted((job for job in self.jobs.values() if job.finished), key=lambda job: job.finished_at)
+        for job in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self.jobs[job.id]
+
+    def _run(self, job, args, kwargs):
+        job.status = "running"
+        pdf_file = io.BytesIO(job._data)
+        pdf_file.name = job.document_name
+        pdf_file.size = job.size
+        try:
+            job.chunk_count = self.index_func(pdf_file, *args, progress=job.advance, **kwargs)
+            job.status = "done" if job.chunk_count else "failed"
+            if not job.chunk_count:
+                job.error = "No text could be extracted from the document"
+        except Exception as e:
+            logger.exception("Ingestion of %s failed", job.document_name)
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            # Traces are kept per thread, so the script thread can only see this one through the job
+            job.trace = tracer.pop_last_trace()
+            job.finished_at = time.time()
+            # The upload is no longer needed once indexed
+            job._data = None
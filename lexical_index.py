@@ -0,0 +1,187 @@
+import os
+import json
+import math
+import sqlite3
+import threading
+import numpy as np
+from array import array
+from collections import Counter
+from typing import List, Dict
+from attribution import tokenize
+from vector_store import Match, QueryResult
+
+class _Postings:
+    """In-memory BM25 postings and statistics of the chunks of one namespace"""
+
+    def __init__(self):
+        self.rows = {}                # chunk id -> row
+        self.ids = []                 # row -> chunk id, None once deleted
+        self.metadata = []            # row -> metadata, None once deleted
+        self.lengths = array("f")     # row -> number of tokens
+        self.alive = array("b")       # row -> 1 while the chunk exists
+        self.postings = {}            # term -> (rows, term frequencies)
+        self.df = Counter()           # term -> number of live chunks containing it
+        self.total_length = 0
+        self.live = 0
+
+    def add(self, chunk_id, metadata):
+        if chunk_id in self.rows:
+            self.remove(chunk_id)
+        tokens = tokenize(metadata["text"])
+        row = len(self.ids)
+        self.rows[chunk_id] = row
+        self.ids.append(chunk_id)
+        self.metadata.append(metadata)
+        self.lengths.append(len(tokens))
+        self.alive.append(1)
+        for term, frequency in Counter(tokens).items():
+            rows, frequencies = self.postings.setdefault(term, (array("i"), array("i")))
+            rows.append(row)
+            frequencies.append(frequency)
+            self.df[term] += 1
+        self.total_length += len(tokens)
+        self.live += 1
+
+    def remove(self, chunk_id):
+        row = self.rows.pop(chunk_id)
+        for term in set(tokenize(self.metadata[row]["text"])):
+            self.df[term] -= 1
+            if not self.df[term]:
+                del self.df[term]
+        self.total_length -= int(self.lengths[row])
+        self.live -= 1
+        self.ids[row] = None
+        self.metadata[row] = None
+        self.alive[row] = 0
+
+    def compacted(self):
+        """A rebuilt copy without deleted rows once they outnumber the live ones, otherwise self"""
+        if len(self.ids) - self.live <= max(self.live, 1000):
+            return self
+        postings = _Postings()
+        for chunk_id, row in self.rows.items():
+            postings.add(chunk_id, self.metadata[row])
+        return postings
+
+    def search(self, terms, top_k, k1, b):
+        lengths = np.array(self.lengths, dtype=np.float32)
+        length_norm = k1 * (1 - b + b * lengths / max(self.total_length / self.live, 1.0))
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for term in terms:
+            df = self.df.get(term)
+            if not df:
+                continue
+            rows, frequencies = self.postings[term]
+            rows = np.array(rows, dtype=np.int32)
+            frequencies = np.array(frequencies, dtype=np.float32)
+            idf = math.log(1 + (self.live - df + 0.5) / (df + 0.5))
+            # Each chunk appears at most once per term, so fancy-indexed += is safe
+            scores[rows] += idf * frequencies * (k1 + 1) / (frequencies + length_norm[rows])
+
+        scores *= np.array(self.alive, dtype=np.float32)
+        candidates = np.flatnonzero(scores > 0)
+        if not len(candidates):
+            return []
+        k = min(top_k, len(candidates))
+        top = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [Match(id=self.ids[row], score=float(scores[row]), metadata=self.metadata[row]) for row in top]
+
+class BM25Index:
+    """
+    Incrementally updated BM25 index over document chunks, kept on local disk
+
+    Each term maps to compact postings arrays of chunk rows and term frequencies,
+    and chunk lengths are precomputed, so a query only touches the postings of
+    its own terms. Chunks are stored in a SQLite table and the postings are
+    rebuilt from it on start-up. Deleted chunks are masked out and their postings
+    reclaimed once they outnumber the live ones. Like the vector stores, chunks
+    live in namespaces (None is the default one), each with its own postings and
+    statistics, so a scoped search never touches other documents.
+    """
+
+    def __init__(self, path, k1=1.5, b=0.75):
+        os.makedirs(path, exist_ok=True)
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(os.path.join(path, "chunks.sqlite3"), check_same_thread=False)
+        columns = [name for _, name, *_ in self._conn.execute("PRAGMA table_info(chunks)")]
+        if columns and "namespace" not in columns:
+            # Indexes written before namespaces existed: their chunks move to the default namespace
+            self._conn.execute("ALTER TABLE chunks RENAME TO chunks_unscoped")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "namespace TEXT NOT NULL, id TEXT NOT NULL, metadata TEXT NOT NULL, PRIMARY KEY (namespace, id))"
+        )
+        if columns and "namespace" not in columns:
+            self._conn.execute("INSERT INTO chunks SELECT '', id, metadata FROM chunks_unscoped")
+            self._conn.execute("DROP TABLE chunks_unscoped")
+        self._conn.commit()
+
+        self._namespaces = {}  # namespace -> _Postings
+        for namespace, chunk_id, metadata in self._conn.execute("SELECT namespace, id, metadata FROM chunks"):
+            self._namespaces.setdefault(namespace, _Postings()).add(chunk_id, json.loads(metadata))
+
+    def contains(self, chunk_id, namespace=None):
+        postings = self._namespaces.get(namespace or "")
+        return postings is not None and chunk_id in postings.rows
+
+    def __len__(self):
+        return sum(postings.live for postings in self._namespaces.values())
+
+    def add(self, chunks: List[Dict], namespace=None):
+        """
+        Index chunks given as ``{"id", "metadata"}`` dicts whose metadata includes
+        the chunk ``text``; an existing chunk with the same id is replaced
+        """
+        if not chunks:
+            return
+        namespace = namespace or ""
+        with self._lock:
+            postings = self._namespaces.setdefault(namespace, _Postings())
+            for chunk in chunks:
+                postings.add(chunk["id"], chunk["metadata"])
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks VALUES (?, ?, ?)",
+                [(namespace, chunk["id"], json.dumps(chunk["metadata"])) for chunk in chunks]
+            )
+            self._conn.commit()
+            self._namespaces[namespace] = postings.compacted()
+
+    def delete(self, ids: List[str] = None, delete_all=False, namespace=None):
+        """
+        Remove chunks by id, or the whole namespace with ``delete_all``; unknown ids are ignored
+        """
+        namespace = namespace or ""
+        with self._lock:
+            postings = self._namespaces.get(namespace)
+            if postings is None:
+                return
+            if delete_all:
+                del self._namespaces[namespace]
+                self._conn.execute("DELETE FROM chunks WHERE namespace = ?", (namespace,))
+                self._conn.commit()
+                return
+            ids = [chunk_id for chunk_id in ids or () if chunk_id in postings.rows]
+            for chunk_id in ids:
+                postings.remove(chunk_id)
+            self._conn.executemany(
+                "DELETE FROM chunks WHERE namespace = ? AND id = ?", [(namespace, chunk_id) for chunk_id in ids]
+            )
+            self._conn.commit()
+            if postings.live:
+                self._namespaces[namespace] = postings.compacted()
+            else:
+                del self._namespaces[namespace]
+
+    def search(self, query: str, top_k=5, namespace=None) -> QueryResult:
+        """
+        Return the ``top_k`` chunks of a namespace with the highest BM25 score for the query
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            postings = self._namespaces.get(namespace or "")
+            if postings is None or not postings.live or not terms or top_k <= 0:
+                return QueryResult(matches=[])
+            return QueryResult(matches=postings.search(terms, top_k, self.k1, self.b))
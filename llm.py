@@ -1,6 +1,18 @@
+import time
+import logging
 import streamlit as st
-from groq import Groq
-from typing import List, Dict
+from typing import List, Dict, TYPE_CHECKING
+from prompt_builder import PromptBuilder
+from tracing import tracer
+
+if TYPE_CHECKING:
+    # Only for annotations: importing groq is deferred until a client is created
+    from groq import Groq
+
+logger = logging.getLogger(__name__)
+
+NO_CHUNKS_RESPONSE = "I couldn't find any relevant information in the uploaded document."
+ERROR_RESPONSE = "I encountered an error while generating a response. Please try again."
 
 # System prompt template
 SYSTEM_PROMPT = """You are a helpful PDF Q&A assistant. Your role is to help users understand and learn from the documents they upload. Follow these guidelines:
@@ -24,7 +36,47 @@ SYSTEM_PROMPT = """You are a helpful PDF Q&A assistant. Your role is to help use
 Current document chunks are provided below. Use these to answer the user's question:
 {document_chunks}"""
 
-def generate_response(query: str, chunks: List[Dict], groq_client: Groq, model: str):
+DEFAULT_PROMPT_BUILDER = PromptBuilder(SYSTEM_PROMPT)
+
+def build_messages(query: str, chunks: List[Dict], prompt_builder: PromptBuilder = None):
+    """
+    Build the chat messages for a query: system prompt with the retrieved chunks,
+    recent conversation history and the current question, within the prompt
+    builder's token budget
+
+    Returns:
+        (messages, breakdown) where breakdown reports the prompt's token usage
+    """
+    history = []
+    if 'messages' in st.session_state:
+        history = st.session_state.messages
+        # The chat interface records the question before answering it; it is sent separately
+        if history and history[-1]["role"] == "user" and history[-1]["content"] == query:
+            history = history[:-1]
+
+    with tracer.span("prompt") as span:
+        messages, breakdown = (prompt_builder or DEFAULT_PROMPT_BUILDER).build(query, chunks, history)
+        span.set(prompt_tokens=breakdown["total"], chunks=breakdown["chunks_included"])
+    logger.info("Prompt token breakdown: %s", breakdown)
+    return messages, breakdown
+
+def request_completion(messages: List[Dict], groq_client: "Groq", model: str):
+    """
+    Send prompt messages to the Groq API and return the answer text; API errors propagate
+    """
+    with tracer.span("llm") as span:
+        response = groq_client.chat.completions.create(
+            model=model,  
+            messages=messages,
+            temperature=0.2,
+            max_tokens=1024
+        )
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            span.set(completion_tokens=usage.completion_tokens)
+    return response.choices[0].message.content
+
+def generate_response(query: str, chunks: List[Dict], groq_client: "Groq", model: str, prompt_builder: PromptBuilder = None):
     """
     Generate response using Groq API
     
@@ -33,42 +85,96 @@ def generate_response(query: str, chunks: List[Dict], groq_client: Groq, model:
         chunks: Retrieved document chunks
         groq_client: Initialized Groq client
         model: LLM model to use
+        prompt_builder: Token-budgeted prompt assembly (defaults to DEFAULT_PROMPT_BUILDER)
     
     Returns:
         Generated response text
     """
     if not chunks:
-        return "I couldn't find any relevant information in the uploaded document."
-    
-    # Format chunks for prompt
-    formatted_chunks = "\n\n".join([f"CHUNK {i+1} (Score: {chunk['score']:.2f}):\n{chunk['text']}" 
-                                     for i, chunk in enumerate(chunks)])
-
-    prev_messages = []
-    if 'messages' in st.session_state:
-        # Get last 10 messages (up to 5 conversation turns)
-        recent_msgs = st.session_state.messages[-10:]
-        for msg in recent_msgs:
-            prev_messages.append({"role": msg["role"], "content": msg["content"]})
-    
-    messages = [
-        {"role": "system", "content": SYSTEM_PROMPT.format(document_chunks=formatted_chunks)}
-    ]
-    
-    if prev_messages:
-        messages.extend(prev_messages)
+        return NO_CHUNKS_RESPONSE
     
-    # Add current query
-    messages.append({"role": "user", "content": query})
+    messages, _ = build_messages(query, chunks, prompt_builder)
     
     try:
-        response = groq_client.chat.completions.create(
-            model=model,  
-            messages=messages,
-            temperature=0.2,
-            max_tokens=1024
-        )
-        return response.choices[0].message.content
+        return request_completion(messages, groq_client, model)
     except Exception as e:
         st.error(f"Error generating response: {str(e)}")
-        return "I encountered an error while generating a response. Please try again."
\ No newline at end of file
+        return ERROR_RESPONSE
+
+class StreamedResponse:
+    """
+    Iterator over the text deltas of a streamed Groq completion
+
+    Iterating it (e.g. with ``st.write_stream``) yields tokens as they arrive. Once
+    exhausted, ``text`` holds the full answer, ``time_to_first_token`` and
+    ``total_latency`` the timings in seconds, ``prompt_breakdown`` the prompt's
+    token usage and ``error`` any failure message.
+    """
+
+    def __init__(self, query: str, chunks: List[Dict], groq_client: "Groq", model: str, prompt_builder: PromptBuilder = None):
+        self.query = query
+        self.chunks = chunks
+        self.groq_client = groq_client
+        self.model = model
+        self.prompt_builder = prompt_builder
+        self.prompt_breakdown = None
+        self.text = ""
+        self.time_to_first_token = None
+        self.total_latency = None
+        self.error = None
+
+    def __iter__(self):
+        start = time.perf_counter()
+        parts = []
+        try:
+            if not self.chunks:
+                parts.append(NO_CHUNKS_RESPONSE)
+                self.time_to_first_token = time.perf_counter() - start
+                yield NO_CHUNKS_RESPONSE
+                return
+
+            messages, self.prompt_breakdown = build_messages(self.query, self.chunks, self.prompt_builder)
+            # The span stays open while the caller renders tokens, matching the latency the user sees
+            with tracer.span("llm") as span:
+                stream = self.groq_client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=0.2,
+                    max_tokens=1024,
+                    stream=True
+                )
+                for chunk in stream:
+                    token = chunk.choices[0].delta.content if chunk.choices else None
+                    if not token:
+                        continue
+                    if self.time_to_first_token is None:
+                        self.time_to_first_token = time.perf_counter() - start
+                    parts.append(token)
+                    span.set(completion_tokens=len(parts))
+                    yield token
+        except Exception as e:
+            self.error = str(e)
+            st.error(f"Error generating response: {str(e)}")
+            # Keep whatever was already streamed and flag that the answer is incomplete
+            message = "\n\n⚠️ The response was interrupted. Please try again." if parts else ERROR_RESPONSE
+            parts.append(message)
+            yield message
+        finally:
+            self.text = "".join(parts)
+            self.total_latency = time.perf_counter() - start
+
+def stream_response(query: str, chunks: List[Dict], groq_client: "Groq", model: str, prompt_builder: PromptBuilder = None) -> StreamedResponse:
+    """
+    Stream a response from the Groq API token by token
+    
+    Args:
+        query: User's question
+        chunks: Retrieved document chunks
+        groq_client: Initialized Groq client
+        model: LLM model to use
+        prompt_builder: Token-budgeted prompt assembly (defaults to DEFAULT_PROMPT_BUILDER)
+    
+    Returns:
+        StreamedResponse to iterate over; it holds the full text and timings afterwards
+    """
+    return StreamedResponse(query, chunks, groq_client, model, prompt_builder)
@@ -1,62 +1,239 @@
+import time
+_SCRIPT_START = time.perf_counter()
+
 import os
-import torch
+import logging
+import functools
+import threading
 import streamlit as st
-from transformers import AutoTokenizer, AutoModel
-import pinecone
-from groq import Groq
 from dotenv import load_dotenv
 
-from app import init_session_state, create_ui, create_sidebar, create_chat_interface
-from llm import generate_response
+from app import init_session_state, create_ui, create_sidebar, create_chat_interface, create_debug_panel, create_startup_status
+from llm import generate_response, stream_response, SYSTEM_PROMPT
+from prompt_builder import PromptBuilder, TokenCounter
+from embedding_cache import EmbeddingCache
+from embedding_backends import EMBEDDING_BACKENDS, load_embedding_model, require_onnx
+from vector_store import LocalVectorStore
+from index_manifest import ManifestStore
+from query_cache import QueryEmbeddingCache, SemanticAnswerCache
+from document_store import ChunkStore, FileStore
+from lexical_index import BM25Index
+from context_compression import ContextCompressor
+from tracing import tracer, JsonlSink, PrometheusTextSink
+from ingestion_worker import IngestionWorker
+from tools import index_pdf_document, collect_expired_namespaces, generate_embeddings_batch
+from startup import startup_timings, Deferred, BootstrapCache
 
-def initialize_components():
-    """Initialize and cache all required components"""
-    try:
-        client = Groq(api_key=GROQ_API_KEY)
-
-        tokenizer = AutoTokenizer.from_pretrained(EMBEDDING_MODEL_NAME)
-        model = AutoModel.from_pretrained(EMBEDDING_MODEL_NAME)
-
-        pc = pinecone.Pinecone(api_key=PINECONE_API_KEY)
-
-        if PINECONE_INDEX_NAME not in pc.list_indexes().names():
-            pc.create_index(
-                name=PINECONE_INDEX_NAME,
-                dimension=768,  
-                metric="cosine", 
-                spec=pinecone.ServerlessSpec(cloud="aws", region="us-east-1")  
-            )
-        
-        # Connect to the index
-        index = pc.Index(PINECONE_INDEX_NAME)
-        return client, tokenizer, model, index
+logger = logging.getLogger(__name__)
+
+# Modules stay imported across reruns, so only the first run of the script pays for this
+if "import modules" not in startup_timings.phases:
+    startup_timings.record("import modules", time.perf_counter() - _SCRIPT_START)
+
+def initialize_llm_client():
+    """Create the Groq client"""
+    with startup_timings.phase("import groq"):
+        from groq import Groq
+    return Groq(api_key=GROQ_API_KEY)
+
+def initialize_embedding_model():
+    """Load the tokenizer and embedding model, then run one forward pass to warm it up"""
+    with startup_timings.phase("import torch"):
+        import torch  # noqa: F401
+    with startup_timings.phase("load embedding model"):
+        tokenizer, model = load_embedding_model(
+            EMBEDDING_MODEL_NAME,
+            EMBEDDING_BACKEND,
+            EMBEDDING_THREADS,
+            EMBEDDING_ONNX_DIR,
+            check_parity=EMBEDDING_PARITY_CHECK
+        )
+    with startup_timings.phase("embedding warm-up"):
+        generate_embeddings_batch(["Warming up the embedding model."], tokenizer, model)
+    return tokenizer, model
+
+def initialize_vector_index(model):
+    """Open the local vector store, or connect to the Pinecone index, creating it on first use"""
+    if VECTOR_STORE_BACKEND == "local":
+        return LocalVectorStore(LOCAL_INDEX_PATH, model.config.hidden_size, dtype=LOCAL_INDEX_DTYPE)
+
+    with startup_timings.phase("import pinecone"):
+        import pinecone
+    pc = pinecone.Pinecone(api_key=PINECONE_API_KEY)
+
+    # Listing indexes is a remote call; once the index is known to exist, skip it
+    bootstrap_cache = BootstrapCache(INDEX_BOOTSTRAP_CACHE_PATH)
+    if f"pinecone:{PINECONE_INDEX_NAME}" not in bootstrap_cache:
+        with startup_timings.phase("check pinecone index"):
+            if PINECONE_INDEX_NAME not in pc.list_indexes().names():
+                pc.create_index(
+                    name=PINECONE_INDEX_NAME,
+                    dimension=768,  
+                    metric="cosine", 
+                    spec=pinecone.ServerlessSpec(cloud="aws", region="us-east-1")  
+                )
+        bootstrap_cache.add(f"pinecone:{PINECONE_INDEX_NAME}")
     
-    except Exception as e:
-        st.error(f"Failed to initialize components: {str(e)}")
-        st.stop()  
+    # Connect to the index
+    return pc.Index(PINECONE_INDEX_NAME)
+
+def initialize_components():
+    """Initialize and cache all required components
+
+    The LLM client, embedding model and vector index are built in background
+    threads and returned as Deferred proxies, so the UI renders right away and
+    only the first use of a component waits for it.
+    """
+    client = Deferred("llm client", initialize_llm_client)
+    embedding = Deferred("embedding model", initialize_embedding_model)
+    tokenizer = embedding.view("tokenizer", lambda components: components[0])
+    model = embedding.view("embedding model", lambda components: components[1])
+    index = Deferred("vector index", lambda: initialize_vector_index(model))
+    return client, tokenizer, model, index
+
+def initialize_embedding_cache(cache_path, model_name, chunk_size, chunk_overlap, max_size_mb):
+    """Open the on-disk embedding cache shared by all sessions"""
+    if max_size_mb <= 0:
+        return None
+    return EmbeddingCache(cache_path, model_name, chunk_size, chunk_overlap, max_size_mb)
+
+def initialize_manifest_store(manifest_dir, index_name, model_name):
+    """Open the per-document chunk manifests used for incremental re-indexing"""
+    return ManifestStore(manifest_dir, index_name, model_name)
+
+def initialize_query_caches(query_cache_size, answer_cache_size, answer_cache_ttl, answer_cache_threshold):
+    """Create the query-embedding and semantic answer caches shared by all sessions"""
+    query_cache = QueryEmbeddingCache(query_cache_size) if query_cache_size > 0 else None
+    answer_cache = None
+    if answer_cache_size > 0:
+        answer_cache = SemanticAnswerCache(answer_cache_threshold, answer_cache_size, answer_cache_ttl)
+    return query_cache, answer_cache
+
+def initialize_document_stores(file_store_dir, file_store_max_mb, chunk_store_size):
+    """Create the uploaded-file store and the source-chunk store shared by all sessions"""
+    chunk_store = ChunkStore(chunk_store_size) if chunk_store_size > 0 else None
+    return FileStore(file_store_dir, file_store_max_mb), chunk_store
+
+def initialize_lexical_index(index_path):
+    """Open the BM25 index used alongside the vector store for hybrid retrieval, in the background"""
+    return Deferred("lexical index", lambda: BM25Index(index_path))
+
+def initialize_prompt_builder(llm_tokenizer_name, token_budget):
+    """Create the token-budgeted prompt builder, counting tokens with the LLM's tokenizer if configured"""
+    llm_tokenizer = None
+    if llm_tokenizer_name:
+        from transformers import AutoTokenizer
+        llm_tokenizer = AutoTokenizer.from_pretrained(llm_tokenizer_name)
+    return PromptBuilder(SYSTEM_PROMPT, TokenCounter(llm_tokenizer), token_budget)
+
+def initialize_tracing(enabled, jsonl_path, prometheus_path):
+    """Configure the process-wide tracer and its metrics sinks"""
+    sinks = []
+    if jsonl_path:
+        sinks.append(JsonlSink(jsonl_path))
+    if prometheus_path:
+        sinks.append(PrometheusTextSink(prometheus_path))
+    return tracer.configure(enabled, sinks)
+
+def initialize_ingestion_worker(max_workers):
+    """Start the background worker pool that indexes uploads for all sessions"""
+    return IngestionWorker(index_pdf_document, max_workers)
+
+def initialize_namespace_gc(_index, _manifest_store, _lexical_index, _ingestion_worker, ttl_seconds):
+    """Start a daemon thread that periodically deletes document namespaces unused for ttl_seconds"""
+    def collect():
+        while True:
+            try:
+                collect_expired_namespaces(_index, _manifest_store, ttl_seconds, _lexical_index, _ingestion_worker)
+            except Exception:
+                logger.exception("Namespace garbage collection failed")
+            time.sleep(min(ttl_seconds / 4, 3600))
+
+    thread = threading.Thread(target=collect, name="namespace-gc", daemon=True)
+    thread.start()
+    return thread
 
 def main():
     load_dotenv()
 
     global APP_TITLE, PINECONE_INDEX_NAME, EMBEDDING_MODEL_NAME
-    global CHUNK_SIZE, CHUNK_OVERLAP, GROQ_API_KEY, PINECONE_API_KEY
-    global FILE_SIZE_LIMIT_MB, LLM_MODEL
+    global CHUNK_SIZE, CHUNK_OVERLAP, CHUNK_MAX_TOKENS, GROQ_API_KEY, PINECONE_API_KEY
+    global FILE_SIZE_LIMIT_MB, FILE_STORE_DIR, FILE_STORE_MAX_MB, CHUNK_STORE_SIZE, LLM_MODEL, EMBEDDING_BATCH_SIZE
+    global EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_MB
+    global EMBEDDING_BACKEND, EMBEDDING_THREADS, EMBEDDING_ONNX_DIR, EMBEDDING_PARITY_CHECK
+    global VECTOR_STORE_BACKEND, LOCAL_INDEX_PATH, LOCAL_INDEX_DTYPE
+    global PDF_EXTRACTION_WORKERS, INGESTION_WORKERS, MANIFEST_DIR, UPSERT_BATCH_SIZE, UPSERT_CONCURRENCY
+    global LLM_TOKENIZER, LLM_PROMPT_TOKEN_BUDGET
+    global LLM_STREAMING, QUERY_CACHE_SIZE, ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_THRESHOLD
+    global DOCUMENT_NAMESPACES, NAMESPACE_TTL_HOURS
+    global HYBRID_RETRIEVAL, LEXICAL_INDEX_PATH, RETRIEVAL_TOP_K, DENSE_TOP_K, LEXICAL_TOP_K, RRF_K
+    global CONTEXT_COMPRESSION_RATIO, CONTEXT_COMPRESSION_NEIGHBORS
+    global TRACING_ENABLED, TRACING_JSONL_PATH, TRACING_PROMETHEUS_PATH, TRACING_DEBUG_PANEL
+    global FAST_STARTUP, INDEX_BOOTSTRAP_CACHE_PATH
     
     # Configuration from environment variables
     APP_TITLE = os.getenv("APP_TITLE", "PDF Assistant")
     PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "assessment")
+    INDEX_BOOTSTRAP_CACHE_PATH = os.getenv("INDEX_BOOTSTRAP_CACHE_PATH", ".cache/index_bootstrap.json")
+    FAST_STARTUP = os.getenv("FAST_STARTUP", "true").lower() in ("1", "true", "yes")
+    VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "pinecone").lower()
+    LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH", ".cache/local_index")
+    LOCAL_INDEX_DTYPE = os.getenv("LOCAL_INDEX_DTYPE", "float32")
+    MANIFEST_DIR = os.getenv("MANIFEST_DIR", ".cache/manifests")
+    DOCUMENT_NAMESPACES = os.getenv("DOCUMENT_NAMESPACES", "true").lower() in ("1", "true", "yes")
+    NAMESPACE_TTL_HOURS = float(os.getenv("NAMESPACE_TTL_HOURS", 168))
+    HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "true").lower() in ("1", "true", "yes")
+    LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", ".cache/lexical_index")
+    RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", 5))
+    DENSE_TOP_K = int(os.getenv("DENSE_TOP_K", 20))
+    LEXICAL_TOP_K = int(os.getenv("LEXICAL_TOP_K", 20))
+    RRF_K = int(os.getenv("RRF_K", 60))
+    UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", 100))
+    UPSERT_CONCURRENCY = int(os.getenv("UPSERT_CONCURRENCY", 4))
     EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/all-mpnet-base-v2")
     CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 1000))
     CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", 100))
+    CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", 510))
+    EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 32))
+    EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+    EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", 0))
+    EMBEDDING_ONNX_DIR = os.getenv("EMBEDDING_ONNX_DIR", ".cache/onnx")
+    EMBEDDING_PARITY_CHECK = os.getenv("EMBEDDING_PARITY_CHECK", "true").lower() in ("1", "true", "yes")
+    EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite3")
+    EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", 256))
     GROQ_API_KEY = os.getenv("GROQ_API_KEY")
     PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
     FILE_SIZE_LIMIT_MB = int(os.getenv("FILE_SIZE_LIMIT_MB", 1))
+    FILE_STORE_DIR = os.getenv("FILE_STORE_DIR", ".cache/files")
+    FILE_STORE_MAX_MB = int(os.getenv("FILE_STORE_MAX_MB", 512))
+    CHUNK_STORE_SIZE = int(os.getenv("CHUNK_STORE_SIZE", 10000))
+    PDF_EXTRACTION_WORKERS = int(os.getenv("PDF_EXTRACTION_WORKERS", 1))
+    INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", 1))
     LLM_MODEL = os.getenv("LLM_MODEL", "llama3-70b-8192")
+    LLM_TOKENIZER = os.getenv("LLM_TOKENIZER", "")
+    LLM_PROMPT_TOKEN_BUDGET = int(os.getenv("LLM_PROMPT_TOKEN_BUDGET", 6000))
+    LLM_STREAMING = os.getenv("LLM_STREAMING", "true").lower() in ("1", "true", "yes")
+    CONTEXT_COMPRESSION_RATIO = float(os.getenv("CONTEXT_COMPRESSION_RATIO", 0.5))
+    CONTEXT_COMPRESSION_NEIGHBORS = int(os.getenv("CONTEXT_COMPRESSION_NEIGHBORS", 1))
+    QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", 1024))
+    ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", 512))
+    ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", 3600))
+    ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95))
+    TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() in ("1", "true", "yes")
+    TRACING_JSONL_PATH = os.getenv("TRACING_JSONL_PATH", "")
+    TRACING_PROMETHEUS_PATH = os.getenv("TRACING_PROMETHEUS_PATH", "")
+    TRACING_DEBUG_PANEL = os.getenv("TRACING_DEBUG_PANEL", "false").lower() in ("1", "true", "yes")
     
     # Validate essential environment variables
     if not GROQ_API_KEY:
         raise ValueError("GROQ_API_KEY environment variable is not set")
-    if not PINECONE_API_KEY:
+    if EMBEDDING_BACKEND not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unsupported EMBEDDING_BACKEND: {EMBEDDING_BACKEND}")
+    if EMBEDDING_BACKEND in ("onnx", "onnx-int8"):
+        require_onnx(EMBEDDING_BACKEND)
+    if VECTOR_STORE_BACKEND not in ("pinecone", "local"):
+        raise ValueError(f"Unsupported VECTOR_STORE_BACKEND: {VECTOR_STORE_BACKEND}")
+    if VECTOR_STORE_BACKEND == "pinecone" and not PINECONE_API_KEY:
         raise ValueError("PINECONE_API_KEY environment variable is not set")
     
     # Initialize session state
@@ -66,7 +243,50 @@ def main():
     create_ui(APP_TITLE, FILE_SIZE_LIMIT_MB)
     
     # Initialize components with Streamlit caching
+    st.cache_resource(initialize_tracing)(TRACING_ENABLED, TRACING_JSONL_PATH, TRACING_PROMETHEUS_PATH)
     groq_client, tokenizer, embedding_model, pinecone_index = st.cache_resource(initialize_components)()
+    embedding_cache = st.cache_resource(initialize_embedding_cache)(
+        EMBEDDING_CACHE_PATH, f"{EMBEDDING_MODEL_NAME}@{EMBEDDING_BACKEND}", CHUNK_SIZE, CHUNK_OVERLAP, EMBEDDING_CACHE_MAX_MB
+    )
+    query_cache, answer_cache = st.cache_resource(initialize_query_caches)(
+        QUERY_CACHE_SIZE, ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_THRESHOLD
+    )
+    file_store, chunk_store = st.cache_resource(initialize_document_stores)(FILE_STORE_DIR, FILE_STORE_MAX_MB, CHUNK_STORE_SIZE)
+    lexical_index = st.cache_resource(initialize_lexical_index)(LEXICAL_INDEX_PATH) if HYBRID_RETRIEVAL else None
+    deferred_components = [groq_client, embedding_model, pinecone_index] + ([lexical_index] if lexical_index else [])
+    if not FAST_STARTUP:
+        # Wait for everything before rendering the rest of the page, as before background loading
+        with st.spinner("Loading models..."):
+            for component in deferred_components:
+                component.wait()
+    create_startup_status(deferred_components)
+    prompt_builder = st.cache_resource(initialize_prompt_builder)(LLM_TOKENIZER, LLM_PROMPT_TOKEN_BUDGET)
+    context_compressor = None
+    if CONTEXT_COMPRESSION_RATIO < 1:
+        context_compressor = ContextCompressor(
+            tokenizer,
+            embedding_model,
+            CONTEXT_COMPRESSION_RATIO,
+            CONTEXT_COMPRESSION_NEIGHBORS,
+            prompt_builder.token_counter,
+            embedding_cache,
+            query_cache,
+            EMBEDDING_BATCH_SIZE
+        )
+    manifest_store = st.cache_resource(initialize_manifest_store)(
+        MANIFEST_DIR,
+        LOCAL_INDEX_PATH if VECTOR_STORE_BACKEND == "local" else PINECONE_INDEX_NAME,
+        # Backends produce slightly different vectors, so switching one re-embeds every chunk
+        f"{EMBEDDING_MODEL_NAME}@{EMBEDDING_BACKEND}"
+    )
+    # With INGESTION_WORKERS=0 uploads are indexed synchronously in the script run
+    ingestion_worker = None
+    if INGESTION_WORKERS > 0:
+        ingestion_worker = st.cache_resource(initialize_ingestion_worker)(INGESTION_WORKERS)
+    if DOCUMENT_NAMESPACES and NAMESPACE_TTL_HOURS > 0:
+        st.cache_resource(initialize_namespace_gc)(
+            pinecone_index, manifest_store, lexical_index, ingestion_worker, NAMESPACE_TTL_HOURS * 3600
+        )
     
     # Create sidebar with file upload functionality
     uploaded_file = create_sidebar(
@@ -75,7 +295,19 @@ def main():
         pinecone_index, 
         CHUNK_SIZE, 
         CHUNK_OVERLAP, 
-        FILE_SIZE_LIMIT_MB
+        FILE_SIZE_LIMIT_MB,
+        ingestion_worker,
+        DOCUMENT_NAMESPACES,
+        file_store,
+        batch_size=EMBEDDING_BATCH_SIZE,
+        embedding_cache=embedding_cache,
+        extraction_workers=PDF_EXTRACTION_WORKERS,
+        manifest_store=manifest_store,
+        upsert_batch_size=UPSERT_BATCH_SIZE,
+        upsert_concurrency=UPSERT_CONCURRENCY,
+        answer_cache=answer_cache,
+        lexical_index=lexical_index,
+        max_chunk_tokens=CHUNK_MAX_TOKENS
     )
     
     # Create chat interface
@@ -85,8 +317,29 @@ def main():
         embedding_model, 
         pinecone_index, 
         LLM_MODEL,
-        generate_response
+        functools.partial(generate_response, prompt_builder=prompt_builder),
+        functools.partial(stream_response, prompt_builder=prompt_builder) if LLM_STREAMING else None,
+        query_cache,
+        answer_cache,
+        context_compressor,
+        manifest_store,
+        chunk_store,
+        top_k=RETRIEVAL_TOP_K,
+        lexical_index=lexical_index,
+        dense_top_k=DENSE_TOP_K,
+        lexical_top_k=LEXICAL_TOP_K,
+        rrf_k=RRF_K
     )
 
+    if "first paint" not in startup_timings.phases:
+        startup_timings.record("first paint", time.perf_counter() - _SCRIPT_START)
+
+    # Timing breakdown of the last ingestion or question, for diagnosing slow requests
+    if TRACING_ENABLED and TRACING_DEBUG_PANEL:
+        finished_job = None
+        if ingestion_worker is not None and st.session_state.finished_ingestion_job:
+            finished_job = ingestion_worker.get(st.session_state.finished_ingestion_job)
+        create_debug_panel(startup_timings.snapshot(), finished_job)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
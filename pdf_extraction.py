@@ -0,0 +1,102 @@
+import io
+import os
+import math
+import tempfile
+import threading
+import multiprocessing
+from collections import deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+import PyPDF2
+
+# Kept free of torch/streamlit imports so spawned workers start quickly
+
+_executor = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+
+_worker_reader_key = None
+_worker_reader = None
+
+def _extract_page_range(path, start, stop):
+    """Extract pages [start, stop) in a worker, reusing the reader for the same file"""
+    global _worker_reader_key, _worker_reader
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    if key != _worker_reader_key:
+        _worker_reader = PyPDF2.PdfReader(path)
+        _worker_reader_key = key
+    return [_worker_reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+def _get_executor(workers):
+    """Return the shared process pool, (re)creating it if the worker count changed"""
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers != workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _executor_workers = workers
+        return _executor
+
+def _pdf_path(pdf_file):
+    """
+    Return (path, is_temporary) for a PDF: its own path when it lives on disk,
+    otherwise a temporary copy of the upload's bytes that workers can open
+    """
+    if isinstance(pdf_file, (str, os.PathLike)):
+        return os.fspath(pdf_file), False
+    if isinstance(pdf_file, io.BufferedReader):
+        return os.fspath(pdf_file.name), False
+
+    if hasattr(pdf_file, "getvalue"):
+        data = pdf_file.getvalue()
+    else:
+        pdf_file.seek(0)
+        data = pdf_file.read()
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+        f.write(data)
+    return f.name, True
+
+def iter_pdf_pages_parallel(pdf_file, workers=0, min_pages=8, progress=None):
+    """
+    Yield (page_number, text) for each page, extracting page ranges in a process pool
+
+    The page range is split into contiguous slices that workers extract by opening the
+    file from disk, so the upload is never pickled per page. Results are yielded in
+    page order with only a few slices per worker in flight. ``workers=0`` uses every
+    available CPU. Documents shorter than ``min_pages`` (or a single worker) are
+    extracted serially so they don't pay for the pool. The page count is reported
+    as ``progress("total_pages", count)`` once the file has been opened.
+    """
+    workers = workers or os.cpu_count() or 1
+    pdf_reader = PyPDF2.PdfReader(pdf_file)
+    num_pages = len(pdf_reader.pages)
+    if progress is not None:
+        progress("total_pages", num_pages)
+
+    if workers <= 1 or num_pages < max(min_pages, 2):
+        for page_number, page in enumerate(pdf_reader.pages, start=1):
+            yield page_number, page.extract_text() or ""
+        return
+
+    executor = _get_executor(workers)
+    pages_per_task = max(1, math.ceil(num_pages / (workers * 4)))
+    ranges = iter([(start, min(start + pages_per_task, num_pages)) for start in range(0, num_pages, pages_per_task)])
+    path, is_temporary = _pdf_path(pdf_file)
+
+    pending = deque()
+    try:
+        pending.extend(executor.submit(_extract_page_range, path, *r) for r in islice(ranges, 2 * workers))
+        page_number = 1
+        while pending:
+            texts = pending.popleft().result()
+            pending.extend(executor.submit(_extract_page_range, path, *r) for r in islice(ranges, 1))
+            for text in texts:
+                yield page_number, text
+                page_number += 1
+    finally:
+        for future in pending:
+            future.cancel()
+        if is_temporary:
+            os.unlink(path)
@@ -0,0 +1,123 @@
+import math
+from typing import List, Dict
+
+# Approximate per-message overhead of the chat template (role markers, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+class TokenCounter:
+    """
+    Count and truncate text in tokens of the target LLM
+
+    Uses a Hugging Face tokenizer matching the LLM when one is given; otherwise
+    falls back to an estimate of ``chars_per_token`` characters per token.
+    """
+
+    def __init__(self, tokenizer=None, chars_per_token=4.0):
+        self.tokenizer = tokenizer
+        self.chars_per_token = chars_per_token
+
+    def count(self, text):
+        if not text:
+            return 0
+        if self.tokenizer is not None:
+            return len(self.tokenizer.encode(text, add_special_tokens=False))
+        return math.ceil(len(text) / self.chars_per_token)
+
+    def truncate(self, text, max_tokens):
+        if max_tokens <= 0:
+            return ""
+        if self.tokenizer is not None:
+            ids = self.tokenizer.encode(text, add_special_tokens=False)
+            if len(ids) <= max_tokens:
+                return text
+            return self.tokenizer.decode(ids[:max_tokens])
+        return text[:int(max_tokens * self.chars_per_token)]
+
+class PromptBuilder:
+    """
+    Assemble chat messages that fit within a token budget
+
+    The budget is filled by priority: the system prompt and the question always go
+    in, then retrieved chunks from highest to lowest score, then conversation history
+    from the most recent message backwards. An item that does not fit is truncated
+    if at least ``min_truncated_tokens`` remain, otherwise it and everything of lower
+    priority in its group is dropped.
+    """
+
+    def __init__(self, system_prompt, token_counter=None, token_budget=6000,
+                 max_history_messages=10, min_truncated_tokens=64):
+        self.system_prompt = system_prompt
+        self.token_counter = token_counter or TokenCounter()
+        self.token_budget = token_budget
+        self.max_history_messages = max_history_messages
+        self.min_truncated_tokens = min_truncated_tokens
+
+    def _fit(self, text, remaining):
+        """Return (text, tokens) fitted into ``remaining`` tokens, or (None, 0) if it doesn't fit"""
+        tokens = self.token_counter.count(text)
+        if tokens <= remaining:
+            return text, tokens
+        if remaining >= self.min_truncated_tokens:
+            text = self.token_counter.truncate(text, remaining)
+            return text, self.token_counter.count(text)
+        return None, 0
+
+    def build(self, query: str, chunks: List[Dict], history: List[Dict]):
+        """
+        Build the message list for a query
+
+        Returns (messages, breakdown) where breakdown reports the tokens spent on
+        each part of the prompt and how many chunks and history messages were kept.
+        """
+        count = self.token_counter.count
+        system_tokens = count(self.system_prompt.format(document_chunks="")) + MESSAGE_OVERHEAD_TOKENS
+        question_tokens = count(query) + MESSAGE_OVERHEAD_TOKENS
+        remaining = self.token_budget - system_tokens - question_tokens
+
+        # Highest-scoring chunks first
+        formatted_chunks = []
+        chunk_tokens = 0
+        truncated_chunks = 0
+        for chunk in sorted(chunks, key=lambda c: c.get("score", 0), reverse=True):
+            header = f"CHUNK {len(formatted_chunks) + 1} (Score: {chunk['score']:.2f}):\n"
+            separator_tokens = count("\n\n") if formatted_chunks else 0
+            available = remaining - count(header) - separator_tokens
+            text, tokens = self._fit(chunk["text"], available)
+            if text is None:
+                break
+            truncated_chunks += text != chunk["text"]
+            formatted_chunks.append(header + text)
+            used = count(header) + separator_tokens + tokens
+            chunk_tokens += used
+            remaining -= used
+
+        # Most recent turns first, restored to chronological order afterwards
+        history_messages = []
+        history_tokens = 0
+        for msg in reversed(history[-self.max_history_messages:] if self.max_history_messages else []):
+            text, tokens = self._fit(msg["content"], remaining - MESSAGE_OVERHEAD_TOKENS)
+            if text is None:
+                break
+            history_messages.append({"role": msg["role"], "content": text})
+            history_tokens += tokens + MESSAGE_OVERHEAD_TOKENS
+            remaining -= tokens + MESSAGE_OVERHEAD_TOKENS
+        history_messages.reverse()
+
+        messages = [{"role": "system", "content": self.system_prompt.format(document_chunks="\n\n".join(formatted_chunks))}]
+        messages.extend(history_messages)
+        messages.append({"role": "user", "content": query})
+
+        breakdown = {
+            "budget": self.token_budget,
+            "system": system_tokens,
+            "question": question_tokens,
+            "chunks": chunk_tokens,
+            "chunks_included": len(formatted_chunks),
+            "chunks_truncated": truncated_chunks,
+            "chunks_dropped": len(chunks) - len(formatted_chunks),
+            "history": history_tokens,
+            "history_included": len(history_messages),
+            "history_dropped": min(len(history), self.max_history_messages) - len(history_messages),
+        }
+        breakdown["total"] = system_tokens + question_tokens + chunk_tokens + history_tokens
+        return messages, breakdown
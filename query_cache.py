@@ -0,0 +1,119 @@
+import time
+import itertools
+import threading
+import numpy as np
+from collections import OrderedDict, namedtuple
+from typing import List, Dict
+
+CachedAnswer = namedtuple("CachedAnswer", ["answer", "chunks", "similarity"])
+
+class QueryEmbeddingCache:
+    """
+    In-process LRU cache mapping query text to its embedding
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, query):
+        with self._lock:
+            embedding = self._entries.get(query)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(query)
+            self.hits += 1
+            return embedding
+
+    def put(self, query, embedding):
+        with self._lock:
+            self._entries[query] = embedding
+            self._entries.move_to_end(query)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+_Entry = namedtuple("_Entry", ["document", "version", "embedding", "answer", "chunks", "created"])
+
+class SemanticAnswerCache:
+    """
+    Cache of generated answers looked up by query-embedding similarity
+
+    Entries are scoped to a document and to that document's index version: when a
+    document is re-indexed, ``invalidate`` bumps its version and drops its answers.
+    A lookup hits when the cosine similarity between the new query and a cached
+    query is at least ``threshold``. Entries expire after ``ttl_seconds`` and the
+    least recently used ones are evicted beyond ``max_entries``.
+    """
+
+    def __init__(self, threshold=0.95, max_entries=512, ttl_seconds=3600):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._versions = {}
+        self._entries = OrderedDict()
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(embedding):
+        embedding = np.asarray(embedding, dtype=np.float32)
+        return embedding / max(np.linalg.norm(embedding), 1e-12)
+
+    def _expired(self, entry, now):
+        return (entry.version != self._versions.get(entry.document, 0)
+                or (self.ttl_seconds and now - entry.created > self.ttl_seconds))
+
+    def lookup(self, document, query_embedding):
+        """
+        Return a CachedAnswer for a sufficiently similar earlier query, or None
+        """
+        query = self._normalize(query_embedding)
+        now = time.time()
+        with self._lock:
+            for entry_id in [i for i, e in self._entries.items() if self._expired(e, now)]:
+                del self._entries[entry_id]
+
+            candidates = [(i, e) for i, e in self._entries.items() if e.document == document]
+            if candidates:
+                similarities = np.stack([e.embedding for _, e in candidates]) @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    entry_id, entry = candidates[best]
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    return CachedAnswer(entry.answer, entry.chunks, float(similarities[best]))
+            self.misses += 1
+            return None
+
+    def store(self, document, query_embedding, answer: str, chunks: List[Dict]):
+        """
+        Cache an answer and its source chunks for the current version of a document
+        """
+        with self._lock:
+            self._entries[next(self._ids)] = _Entry(
+                document, self._versions.get(document, 0), self._normalize(query_embedding),
+                answer, chunks, time.time()
+            )
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, document):
+        """
+        Drop all cached answers for a document, e.g. after it has been re-indexed
+        """
+        with self._lock:
+            self._versions[document] = self._versions.get(document, 0) + 1
+            for entry_id in [i for i, e in self._entries.items() if e.document == document]:
+                del self._entries[entry_id]
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
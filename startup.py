@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+class StartupTimings:
+    """
+    Wall-clock duration of each start-up phase (imports, model loading, warm-up, ...)
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.phases = {}
+        self._lock = threading.Lock()
+
+    def record(self, phase, seconds):
+        with self._lock:
+            self.phases[phase] = seconds
+        logger.info("Start-up phase %s took %.2fs", phase, seconds)
+
+    @contextmanager
+    def phase(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, time.perf_counter() - start)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.phases)
+
+# One per process: modules are imported once, while the Streamlit script reruns
+startup_timings = StartupTimings()
+
+class Deferred:
+    """
+    Proxy for an object that is built in a background thread
+
+    Attribute access and calls are forwarded to the object, blocking until it is
+    ready, so code holding the proxy only waits when it actually uses it. An
+    exception raised while building is re-raised on every use. ``view`` gives a
+    proxy for a part of the result (e.g. one item of a tuple) sharing the build.
+    """
+
+    def __init__(self, name, factory=None, _future=None, _select=None):
+        self._name = name
+        self._select = _select
+        self._future = _future
+        if _future is None:
+            self._future = Future()
+            threading.Thread(target=self._build, args=(factory,), name=f"load-{name}", daemon=True).start()
+
+    def _build(self, factory):
+        try:
+            with startup_timings.phase(self._name):
+                value = factory()
+        except BaseException as e:
+            logger.exception("Building %s failed", self._name)
+            self._future.set_exception(e)
+        else:
+            self._future.set_result(value)
+
+    def view(self, name, select):
+        return Deferred(name, _future=self._future, _select=select)
+
+    def ready(self):
+        return self._future.done()
+
+    def error(self):
+        """The exception raised while building, once finished, else None"""
+        return self._future.exception() if self._future.done() else None
+
+    def wait(self, timeout=None):
+        """Block until the object is built (or failed to build), without raising"""
+        try:
+            self._future.exception(timeout)
+        except FutureTimeoutError:
+            pass
+
+    def resolve(self, timeout=None):
+        value = self._future.result(timeout)
+        return self._select(value) if self._select else value
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self.resolve(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+
+    def __repr__(self):
+        state = "ready" if self.ready() else "loading"
+        return f"<Deferred {self._name} ({state})>"
+
+class BootstrapCache:
+    """
+    Small JSON file remembering start-up checks that have passed (such as a
+    vector index existing), so later cold starts can skip the remote calls.
+    Delete the file to force the checks to run again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self._keys = set(json.load(f))
+        except (FileNotFoundError, json.JSONDecodeError):
+            self._keys = set()
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def add(self, key):
+        self._keys.add(key)
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(sorted(self._keys), f)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
@@ -0,0 +1,75 @@
+import re
+import time
+from types import SimpleNamespace
+from collections import defaultdict
+
+CHUNK_PATTERN = re.compile(r"CHUNK \d+ \(Score: [^)]*\):\n(.*?)(?=\n\nCHUNK \d+ \(Score|\Z)", re.DOTALL)
+SENTENCE_PATTERN = re.compile(r"[^.!?\n]+[.!?]?")
+
+class StubGroqClient:
+    """
+    Offline stand-in for ``groq.Groq`` with configurable latency
+
+    Answers are stitched together from the first sentences of the document chunks
+    in the system prompt, so downstream source highlighting has something to match.
+    Supports both blocking and ``stream=True`` calls of ``chat.completions.create``.
+    """
+
+    def __init__(self, first_token_latency=0.2, token_latency=0.01, answer_sentences=3):
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.answer_sentences = answer_sentences
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _answer(self, messages, max_tokens):
+        system_prompt = messages[0]["content"] if messages else ""
+        sentences = []
+        for chunk in CHUNK_PATTERN.findall(system_prompt):
+            sentences.extend(s.strip() for s in SENTENCE_PATTERN.findall(chunk) if s.strip())
+            if len(sentences) >= self.answer_sentences:
+                break
+        answer = " ".join(sentences[:self.answer_sentences]) or "I couldn't find relevant information in the uploaded document."
+        return re.findall(r"\S+\s*", answer)[:max_tokens]
+
+    def _create(self, model, messages, temperature=None, max_tokens=1024, stream=False, **kwargs):
+        tokens = self._answer(messages, max_tokens)
+        if stream:
+            return self._stream(tokens)
+        time.sleep(self.first_token_latency + self.token_latency * len(tokens))
+        message = SimpleNamespace(role="assistant", content="".join(tokens))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    def _stream(self, tokens):
+        time.sleep(self.first_token_latency)
+        for token in tokens:
+            time.sleep(self.token_latency)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=token))])
+
+class LatencyInjectedIndex:
+    """
+    Wrap a vector store, adding a fixed delay to every call and recording call durations
+    """
+
+    def __init__(self, index, query_latency=0.0, upsert_latency=0.0, delete_latency=0.0):
+        self.index = index
+        self.latency = {"query": query_latency, "upsert": upsert_latency, "delete": delete_latency}
+        self.timings = defaultdict(list)
+
+    def _call(self, operation, func, **kwargs):
+        start = time.perf_counter()
+        time.sleep(self.latency[operation])
+        result = func(**kwargs)
+        self.timings[operation].append(time.perf_counter() - start)
+        return result
+
+    def upsert(self, vectors, **kwargs):
+        return self._call("upsert", self.index.upsert, vectors=vectors, **kwargs)
+
+    def delete(self, ids=None, **kwargs):
+        return self._call("delete", self.index.delete, ids=ids, **kwargs)
+
+    def query(self, **kwargs):
+        return self._call("query", self.index.query, **kwargs)
+
+    def fetch(self, ids, **kwargs):
+        return self._call("query", self.index.fetch, ids=ids, **kwargs)
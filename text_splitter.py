@@ -0,0 +1,163 @@
+from collections import namedtuple
+
+# A chunk of a document: ``text`` is ``document[start:end]`` where the document
+# is the pages' text joined with a newline after each page, and ``page`` is the
+# page the chunk starts on
+TextChunk = namedtuple("TextChunk", ["text", "page", "start", "end"])
+
+DEFAULT_SEPARATORS = ("\n\n", "\n", " ")
+
+class StreamingTextSplitter:
+    """
+    Single-pass splitter of a stream of pages into overlapping chunks
+
+    Keeps the chunk_size/chunk_overlap rules of LangChain's
+    RecursiveCharacterTextSplitter: a chunk is at most ``chunk_size`` characters,
+    ends at the highest-priority separator (paragraph, then line, then word, then
+    any character) that fits, and starts with up to ``chunk_overlap`` characters
+    of whole pieces from the end of the previous chunk; surrounding whitespace is
+    trimmed. Instead of splitting the text recursively, each chunk is cut by
+    searching backwards from the furthest possible end, so every character is
+    looked at a bounded number of times and only about one chunk plus one page of
+    text is held in memory. Chunks are therefore filled greedily, and tend to be
+    fewer and longer than LangChain's, which never packs the pieces of an
+    oversized paragraph together with its neighbours.
+
+    With a ``tokenizer``, chunks are also kept within ``max_tokens`` tokens of
+    it, so they are never truncated by the embedding model.
+    """
+
+    def __init__(self, chunk_size=1000, chunk_overlap=100, separators=DEFAULT_SEPARATORS, tokenizer=None, max_tokens=None):
+        if chunk_overlap >= chunk_size:
+            raise ValueError(f"chunk_overlap ({chunk_overlap}) must be smaller than chunk_size ({chunk_size})")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = tuple(separators)
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens if tokenizer is not None else None
+        self._lookahead = max((len(separator) for separator in self.separators), default=0)
+
+    def count_tokens(self, text):
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+    def _cut(self, buffer, start, limit, after):
+        """
+        End of the chunk starting at ``start``: the last occurrence, after ``after``
+        and no later than ``limit``, of the highest-priority separator that has one.
+        Returns (end, level) with level len(separators) for a hard character cut,
+        or (None, None) if no separator qualifies.
+        """
+        for level, separator in enumerate(self.separators):
+            end = buffer.rfind(separator, after + 1, limit + len(separator))
+            if end > start:
+                return end, level
+        return None, None
+
+    def _overlap_start(self, buffer, start, end, level):
+        """
+        Start of the next chunk: the earliest boundary within chunk_overlap of ``end``
+        of the highest-priority separator that has one, so the overlap is whole pieces
+        """
+        if not self.chunk_overlap:
+            return end
+        window = max(end - self.chunk_overlap, start + 1)
+        if level == len(self.separators):
+            return window
+        for separator in self.separators:
+            boundary = buffer.find(separator, window, end)
+            if boundary >= 0:
+                return boundary
+        return end
+
+    def _fit_tokens(self, buffer, start, end, level):
+        """Move ``end`` back until the chunk fits in max_tokens"""
+        while end - start > self.max_tokens:
+            tokens = self.count_tokens(buffer[start:end])
+            if tokens <= self.max_tokens:
+                break
+            # Aim for a proportionally shorter chunk, cut at a separator if there is one
+            limit = start + max(1, (end - start) * self.max_tokens // tokens)
+            new_end, new_level = self._cut(buffer, start, limit, start)
+            if new_end is None or new_end >= end:
+                new_end, new_level = min(limit, end - 1), len(self.separators)
+            end, level = new_end, new_level
+        return end, level
+
+    def split_pages(self, pages):
+        """
+        Yield a TextChunk for each chunk of an iterable of (page_number, text) pages
+        """
+        buffer = ""
+        offset = 0        # document offset of buffer[0]
+        page_starts = []  # (document offset, page number) of the pages still in the buffer
+        start = 0         # buffer index where the next chunk starts
+        previous_end = 0  # buffer index where the previous chunk ended
+        pages = iter(pages)
+        exhausted = False
+
+        while True:
+            # Skip the whitespace a chunk would be trimmed of
+            while start < len(buffer) and buffer[start].isspace():
+                start += 1
+            if start > previous_end:
+                previous_end = start
+
+            # Read pages until the furthest possible end of the chunk is in the buffer
+            while not exhausted and len(buffer) < start + self.chunk_size + self._lookahead:
+                page = next(pages, None)
+                if page is None:
+                    exhausted = True
+                    break
+                page_number, text = page
+                # Drop text already emitted, so the buffer stays around one chunk long
+                if start > len(buffer) // 2:
+                    drop = start
+                    buffer = buffer[drop:]
+                    offset += drop
+                    start -= drop
+                    previous_end -= drop
+                    page_starts = [entry for i, entry in enumerate(page_starts)
+                                   if i + 1 == len(page_starts) or page_starts[i + 1][0] > offset]
+                page_starts.append((offset + len(buffer), page_number))
+                buffer += text + "\n"
+                while start < len(buffer) and buffer[start].isspace():
+                    start += 1
+                previous_end = max(previous_end, start)
+
+            if start >= len(buffer):
+                return
+
+            limit = start + self.chunk_size
+            if exhausted and len(buffer) <= limit:
+                end, level = len(buffer), len(self.separators)
+            else:
+                # Pieces must reach past the previous chunk, or the overlap is dropped
+                end, level = self._cut(buffer, start, limit, previous_end)
+                if end is None:
+                    # An unbroken run of characters: cut it where the chunk is full,
+                    # keeping the overlap (start is within chunk_overlap of previous_end)
+                    end, level = min(limit, len(buffer)), len(self.separators)
+            if self.max_tokens:
+                end, level = self._fit_tokens(buffer, start, end, level)
+
+            text_end = end
+            while buffer[text_end - 1].isspace():
+                text_end -= 1
+            document_start = offset + start
+            page = page_starts[0][1]
+            for page_offset, number in page_starts:
+                if page_offset > document_start:
+                    break
+                page = number
+            yield TextChunk(buffer[start:text_end], page, document_start, offset + text_end)
+
+            if exhausted and end >= len(buffer):
+                return
+            previous_end = end
+            start = self._overlap_start(buffer, start, end, level)
+
+    def split_text(self, text):
+        """
+        Split a single text, returning its TextChunks
+        """
+        return list(self.split_pages([(1, text)]))
@@ -1,14 +1,26 @@
-import torch
+import numpy as np
 import PyPDF2
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-import base64
+import logging
 import streamlit as st
 from typing import List, Dict
+from pdf_extraction import iter_pdf_pages_parallel
+from index_manifest import chunk_digest, chunk_vector_id
+from upsert_writer import UpsertWriter
+from attribution import attribute_chunks
+from text_splitter import StreamingTextSplitter
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# torch is imported by the functions that use them, so importing
+# this module (and rendering the app) does not wait for them
 
 def mean_pooling(model_output, attention_mask):
     """
     Perform mean pooling on token embeddings to create sentence embeddings
     """
+    import torch
+
     token_embeddings = model_output[0]
     input_mask_expanded = attention_mask.unsqueeze(-1).expand(token_embeddings.size()).float()
     return torch.sum(token_embeddings * input_mask_expanded, 1) / torch.clamp(input_mask_expanded.sum(1), min=1e-9)
@@ -17,80 +29,336 @@ def generate_embeddings(text, tokenizer, model):
     """
     Generate embeddings for the given text using the provided tokenizer and model
     """
-    encoded_input = tokenizer(text, padding=True, truncation=True, max_length=512, return_tensors='pt')
-    with torch.no_grad():
-        model_output = model(**encoded_input)
-    return mean_pooling(model_output, encoded_input['attention_mask']).squeeze().tolist()
+    return generate_embeddings_batch([text], tokenizer, model)[0].tolist()
+
+def generate_embeddings_batch(texts, tokenizer, model, batch_size=32):
+    """
+    Generate embeddings for a list of texts as a single (len(texts), dim) float32 matrix
+
+    Texts are tokenized once, sorted by token length and fed through the model in
+    batches of ``batch_size`` so each batch is only padded to its own longest item.
+    Rows of the returned matrix follow the original order of ``texts``.
+    """
+    import torch
+
+    embeddings = np.empty((len(texts), model.config.hidden_size), dtype=np.float32)
+    if not texts:
+        return embeddings
+
+    encoded = tokenizer(list(texts), truncation=True, max_length=512)
+    order = np.argsort([len(ids) for ids in encoded['input_ids']], kind='stable')
+
+    with torch.inference_mode():
+        for start in range(0, len(texts), batch_size):
+            batch_idx = order[start:start + batch_size]
+            encoded_input = tokenizer.pad(
+                {key: [encoded[key][i] for i in batch_idx] for key in encoded.keys()},
+                padding=True,
+                return_tensors='pt'
+            )
+            model_output = model(**encoded_input)
+            embeddings[batch_idx] = mean_pooling(model_output, encoded_input['attention_mask']).numpy()
+
+    return embeddings
+
+def embed_chunks(chunks, tokenizer, model, batch_size=32, embedding_cache=None):
+    """
+    Embed document chunks, reusing cached embeddings and only running the model on misses
+    """
+    if embedding_cache is None:
+        return generate_embeddings_batch(chunks, tokenizer, model, batch_size=batch_size)
+
+    cached, missing = embedding_cache.get_many(chunks)
+    embeddings = np.empty((len(chunks), model.config.hidden_size), dtype=np.float32)
+    for i, vector in enumerate(cached):
+        if vector is not None:
+            embeddings[i] = vector
+
+    if missing:
+        missing_chunks = [chunks[i] for i in missing]
+        computed = generate_embeddings_batch(missing_chunks, tokenizer, model, batch_size=batch_size)
+        embeddings[missing] = computed
+        embedding_cache.put_many(missing_chunks, computed)
+
+    return embeddings
+
+def iter_pdf_pages(pdf_file, workers=1, progress=None):
+    """
+    Yield (page_number, text) for each page of a PDF file, one page at a time
+
+    With ``workers`` other than 1, pages are extracted by a process pool
+    (0 means one worker per CPU). The page count is reported as
+    ``progress("total_pages", count)`` before the first page.
+    """
+    if workers != 1:
+        yield from iter_pdf_pages_parallel(pdf_file, workers, progress=progress)
+        return
+
+    pdf_reader = PyPDF2.PdfReader(pdf_file)
+    if progress is not None:
+        progress("total_pages", len(pdf_reader.pages))
+    for page_number, page in enumerate(pdf_reader.pages, start=1):
+        yield page_number, page.extract_text() or ""
 
 def extract_text_from_pdf(uploaded_file):
     """
     Extract text content from a PDF file
     """
     try:
-        pdf_reader = PyPDF2.PdfReader(uploaded_file)
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-        return text
+        return "".join(text + "\n" for _, text in iter_pdf_pages(uploaded_file))
     except Exception as e:
         st.error(f"Error reading PDF file: {str(e)}")
         return None
 
-def process_pdf_document(pdf_file, tokenizer, model, pinecone_index, chunk_size, chunk_overlap):
+def iter_document_chunks(pages, chunk_size, chunk_overlap, tokenizer=None, max_tokens=None):
     """
-    Process PDF document and store chunks in Pinecone
+    Split a stream of (page_number, text) pages into TextChunk records
+
+    Pages are split in a single pass with a StreamingTextSplitter, so chunk
+    boundaries and overlap carry across page breaks and only about a chunk of
+    text is buffered. Each chunk records the page it starts on and its character
+    offsets in the document text. With a ``tokenizer``, chunks are also kept
+    within ``max_tokens`` of its tokens.
     """
-    # Extract text from PDF
-    text = extract_text_from_pdf(pdf_file)
-    if not text:
-        return False, 0
-    
+    text_splitter = StreamingTextSplitter(chunk_size, chunk_overlap, tokenizer=tokenizer, max_tokens=max_tokens)
+    return text_splitter.split_pages(pages)
+
+def iter_batches(items, batch_size):
+    """
+    Group an iterable into lists of at most ``batch_size`` items
+    """
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def iter_counted(items, progress, stage):
+    """
+    Pass items through unchanged, reporting each one as ``progress(stage, 1)``
+    """
+    for item in items:
+        progress(stage, 1)
+        yield item
+
+def chunk_metadata(chunk, document_name, chunk_id):
+    """
+    Metadata stored with a chunk in the vector store and the lexical index
+    """
+    return {
+        "text": chunk.text,
+        "source": document_name,
+        "chunk_id": chunk_id,
+        "page": chunk.page,
+        "start": chunk.start,
+        "end": chunk.end
+    }
+
+def index_pdf_document(pdf_file, tokenizer, model, pinecone_index, chunk_size, chunk_overlap, batch_size=32, embedding_cache=None, upsert_batch_size=100, extraction_workers=1, manifest_store=None, upsert_concurrency=4, answer_cache=None, lexical_index=None, progress=None, namespace=None, max_chunk_tokens=None):
+    """
+    Extract, split, embed and store the chunks of a PDF document in Pinecone,
+    returning the number of chunks; errors are raised
+
+    Pages are extracted, split, embedded and upserted as a stream, so at most
+    ``upsert_batch_size`` chunks and their vectors are held in memory at once.
+    Writes go through an UpsertWriter with ``upsert_concurrency`` threads, whose
+    bounded queue holds back embedding while the vector store catches up.
+    With a ``manifest_store``, chunks whose content is unchanged since the last
+    indexing run are skipped, and chunks that no longer exist are deleted.
+    Chunks are also added to ``lexical_index`` (a BM25Index) for hybrid retrieval;
+    unchanged chunks it does not hold yet are added without re-embedding them.
+    If anything in the index changed, cached answers for the document in
+    ``answer_cache`` are invalidated. Each stage is timed as a span of an
+    "ingest" trace, and ``progress(stage, count)`` is called with the page count
+    ("total_pages") once the PDF is opened and as pages are extracted, chunks
+    split and embedded and vectors written. Vectors and lexical
+    entries are written to ``namespace`` (None for the default namespace).
+    With ``max_chunk_tokens``, chunks are also kept within that many tokens of the
+    embedding tokenizer, so the model never truncates them. Chunk metadata records
+    the page each chunk starts on and its ``start``/``end`` offsets in the text.
+    """
+    progress = progress or (lambda stage, count: None)
     document_name = pdf_file.name
-    
-    # Split text into chunks
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap
-    )
-    chunks = text_splitter.split_text(text)
-    
-    # Generate embeddings and store in Pinecone
-    vectors = []
-    for i, chunk in enumerate(chunks):
-        chunk_id = f"{document_name}_chunk_{i}"
-        vectors.append({
-            "id": chunk_id,
-            "values": generate_embeddings(chunk, tokenizer, model),
-            "metadata": {
-                "text": chunk,
-                "source": document_name,
-                "chunk_id": i
-            }
-        })
-    
-    # Delete existing vectors for this document if any
-    existing_ids = [f"{document_name}_chunk_{i}" for i in range(len(chunks))]
+    previous_manifest = manifest_store.load(document_name, namespace) if manifest_store else {}
+    manifest = {}
+    chunk_count = 0
+    index_modified = False
+
     try:
-        pinecone_index.delete(ids=existing_ids)
-    except:
-        pass  # Ignore if no existing vectors
-    
-    # Insert new vectors
-    pinecone_index.upsert(vectors=vectors)
-    
-    return True, len(chunks)
+        with tracer.trace("ingest", document=document_name, bytes=getattr(pdf_file, "size", 0)), \
+                UpsertWriter(pinecone_index, max_batch_size=upsert_batch_size, max_workers=upsert_concurrency,
+                             on_written=lambda operation, count: progress("vectors" if operation == "upsert" else "deleted", count),
+                             namespace=namespace) as writer:
+            pages = iter_counted(iter_pdf_pages(pdf_file, extraction_workers, progress), progress, "pages")
+            pages = tracer.timed("extract", pages, item="pages")
+            chunks = tracer.timed("split", iter_document_chunks(
+                pages, chunk_size, chunk_overlap, tokenizer if max_chunk_tokens else None, max_chunk_tokens
+            ), item="chunks")
+            for batch in iter_batches(chunks, upsert_batch_size):
+                changed = []
+                unindexed = []
+                for offset, chunk in enumerate(batch):
+                    i = chunk_count + offset
+                    chunk_id = chunk_vector_id(document_name, i)
+                    digest = chunk_digest(chunk.text)
+                    manifest[chunk_id] = digest
+                    if previous_manifest.get(chunk_id) != digest:
+                        changed.append((i, chunk))
+                    elif lexical_index is not None and not lexical_index.contains(chunk_id, namespace):
+                        unindexed.append((i, chunk))
+                chunk_count += len(batch)
+                progress("chunks", len(batch))
+
+                if lexical_index is not None and (changed or unindexed):
+                    with tracer.span("lexical_index", chunks=len(changed) + len(unindexed)):
+                        lexical_index.add([{
+                            "id": chunk_vector_id(document_name, i),
+                            "metadata": chunk_metadata(chunk, document_name, i)
+                        } for i, chunk in changed + unindexed], namespace)
+                if not changed:
+                    continue
+
+                # Generate embeddings in batches (skipping cached chunks) and store in Pinecone
+                with tracer.span("embed", chunks=len(changed)):
+                    embeddings = embed_chunks([chunk.text for _, chunk in changed], tokenizer, model, batch_size, embedding_cache)
+                progress("embedded", len(changed))
+                vectors = []
+                for (i, chunk), embedding in zip(changed, embeddings):
+                    vectors.append({
+                        "id": chunk_vector_id(document_name, i),
+                        "values": embedding.tolist(),
+                        "metadata": chunk_metadata(chunk, document_name, i)
+                    })
+
+                # Upserting overwrites any existing vectors with the same ids
+                index_modified = True
+                with tracer.span("upsert", vectors=len(vectors)):
+                    writer.upsert(vectors)
 
-def retrieve_relevant_chunks(query, pinecone_index, tokenizer, model, top_k=5):
+            # Remove chunks left over from a previous, longer version of the document
+            removed_ids = [chunk_id for chunk_id in previous_manifest if chunk_id not in manifest]
+            index_modified = index_modified or bool(removed_ids)
+            if lexical_index is not None:
+                lexical_index.delete(removed_ids, namespace=namespace)
+            with tracer.span("upsert", deleted=len(removed_ids)):
+                writer.delete(removed_ids)
+                # Wait for the queued writes here so the drain is timed as part of the upsert stage
+                writer.close()
+
+        logger.info("Indexed %s: %s", document_name, writer.summary())
+        if manifest_store:
+            manifest_store.save(document_name, manifest, namespace)
+    finally:
+        if answer_cache is not None and index_modified:
+            answer_cache.invalidate(namespace or document_name)
+
+    return chunk_count
+
+def process_pdf_document(pdf_file, tokenizer, model, pinecone_index, chunk_size, chunk_overlap, **options):
     """
-    Retrieve relevant chunks based on query
+    Process PDF document and store chunks in Pinecone
+
+    Keyword options are those of index_pdf_document. Returns (success, chunk_count);
+    errors are shown in the UI.
     """
-    query_embedding = generate_embeddings(query, tokenizer, model)
+    try:
+        chunk_count = index_pdf_document(pdf_file, tokenizer, model, pinecone_index, chunk_size, chunk_overlap, **options)
+    except Exception as e:
+        st.error(f"Error processing PDF file: {str(e)}")
+        return False, 0
+
+    return chunk_count > 0, chunk_count
+
+def collect_expired_namespaces(pinecone_index, manifest_store, ttl_seconds, lexical_index=None, ingestion_worker=None):
+    """
+    Delete the vectors, lexical entries and manifests of document namespaces
+    unused for ``ttl_seconds``; returns the namespaces removed. A namespace
+    whose vectors could not be deleted keeps its manifests and is retried later.
+    Finished ``ingestion_worker`` jobs for removed namespaces are dropped, so
+    uploading the same file again re-indexes it.
+    """
+    removed = []
+    for namespace in manifest_store.expired_namespaces(ttl_seconds):
+        try:
+            pinecone_index.delete(delete_all=True, namespace=namespace)
+        except Exception as e:
+            logger.warning("Could not delete namespace %s: %s", namespace, e)
+            continue
+        if lexical_index is not None:
+            lexical_index.delete(delete_all=True, namespace=namespace)
+        manifest_store.remove_namespace(namespace)
+        if ingestion_worker is not None:
+            ingestion_worker.forget_namespace(namespace)
+        removed.append(namespace)
+    if removed:
+        logger.info("Garbage-collected %d expired namespaces", len(removed))
+    return removed
+
+def embed_query(query, tokenizer, model, query_cache=None):
+    """
+    Embed a query, reusing the embedding of an identical earlier query if cached
+    """
+    if query_cache is not None:
+        query_embedding = query_cache.get(query)
+        if query_embedding is not None:
+            return query_embedding
+
+    with tracer.span("embed_query"):
+        query_embedding = generate_embeddings_batch([query], tokenizer, model)[0]
+    if query_cache is not None:
+        query_cache.put(query, query_embedding)
+    return query_embedding
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Fuse ranked lists of ids: an id scores the sum of 1 / (k + rank) over the lists
+    it appears in. Returns (id, score) pairs, best first.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+def retrieve_relevant_chunks(query, pinecone_index, tokenizer, model, top_k=5, query_cache=None, lexical_index=None, dense_top_k=None, lexical_top_k=None, rrf_k=60, namespace=None):
+    """
+    Retrieve relevant chunks based on query, searching only the given ``namespace``
+
+    With a ``lexical_index``, the ``dense_top_k`` nearest chunks and the
+    ``lexical_top_k`` best BM25 matches (both default to ``top_k``) are fused by
+    reciprocal-rank fusion and the best ``top_k`` are returned, scored by RRF.
+    """
+    query_embedding = embed_query(query, tokenizer, model, query_cache).tolist()
+    dense_top_k = dense_top_k or top_k
     
-    results = pinecone_index.query(
-        vector=query_embedding,
-        top_k=top_k,
-        include_metadata=True
-    )
+    with tracer.span("vector_query") as span:
+        results = pinecone_index.query(
+            vector=query_embedding,
+            top_k=dense_top_k if lexical_index is not None else top_k,
+            include_metadata=True,
+            namespace=namespace
+        )
+        span.set(matches=len(results.matches))
+
+    if lexical_index is not None:
+        with tracer.span("lexical_query") as span:
+            lexical_results = lexical_index.search(query, lexical_top_k or top_k, namespace)
+            span.set(matches=len(lexical_results.matches))
+
+        metadata = {match.id: match.metadata for match in lexical_results.matches}
+        metadata.update((match.id, match.metadata) for match in results.matches)
+        fused = reciprocal_rank_fusion(
+            [[match.id for match in results.matches], [match.id for match in lexical_results.matches]], rrf_k
+        )
+        return [{
+            "text": metadata[chunk_id]['text'],
+            "score": score,
+            "source": metadata[chunk_id]['source'],
+            "chunk_id": metadata[chunk_id]['chunk_id']
+        } for chunk_id, score in fused[:top_k]]
     
     if not results.matches:
         return []
@@ -109,39 +377,9 @@ def retrieve_relevant_chunks(query, pinecone_index, tokenizer, model, top_k=5):
 def highlight_matching_chunks(response, chunks):
     """
     Extract and highlight chunks that match the response
-    """
-    highlighted_chunks = []
-    
-    for chunk in chunks:
-        chunk_text = chunk["text"]
-        chunk_source = chunk["source"]
-        chunk_id = chunk["chunk_id"]
-        
-        words = set(chunk_text.lower().split())
-        significant_words = [w for w in words if len(w) > 5]  # Only consider words longer than 5 chars
-        
-        # Calculate overlap between response and significant words
-        if significant_words:
-            matches = sum(1 for word in significant_words if word in response.lower())
-            match_ratio = matches / len(significant_words)
-            
-            if match_ratio > 0.2:  # If more than 20% of significant words appear in response
-                highlighted_chunks.append({
-                    "text": chunk_text,
-                    "source": chunk_source,
-                    "chunk_id": chunk_id,
-                    "match_score": match_ratio
-                })
-    
-    # Sort by match score
-    highlighted_chunks.sort(key=lambda x: x["match_score"], reverse=True)
-    return highlighted_chunks[:3]
 
-def get_pdf_download_link(file_name):
-    """
-    Generate a link allowing the user to download the uploaded PDF file
+    A chunk matches when more than 20% of its significant words (longer than 5
+    characters) appear as whole words in the response; the best 3 are returned.
     """
-    with open(file_name, "rb") as file:
-        b64 = base64.b64encode(file.read()).decode()
-    href = f'<a href="data:application/octet-stream;base64,{b64}" download="{file_name}">Download PDF</a>'
-    return href
\ No newline at end of file
+    with tracer.span("attribution", chunks=len(chunks)):
+        return attribute_chunks(response, chunks, threshold=0.2, top_n=3)
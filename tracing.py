@@ -0,0 +1,272 @@
+import os
+import json
+import time
+import tempfile
+import threading
+from collections import defaultdict
+
+# Upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class Histogram:
+    """
+    Cumulative latency histogram with fixed buckets, in the Prometheus sense
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+class _NullSpan:
+    """Stand-in returned while tracing is disabled, so instrumented code costs next to nothing"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+NULL_SPAN = _NullSpan()
+
+class Span:
+    """
+    A timed stage of a request
+
+    Time spent in nested spans is subtracted, so each stage reports its own time.
+    Numeric attributes (pages, chunks, tokens, vectors, ...) are summed per stage.
+    """
+
+    def __init__(self, tracer, name, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.child_seconds = 0.0
+        self.start = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self.tracer._stack().append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        stack = self.tracer._stack()
+        stack.remove(self)
+        if stack:
+            stack[-1].child_seconds += seconds
+        if exc_type is not None:
+            self.attributes["errors"] = self.attributes.get("errors", 0) + 1
+        self.tracer._record(self.name, seconds - self.child_seconds, self.attributes)
+        return False
+
+class Trace(Span):
+    """
+    One request (a document ingestion or a question) and the breakdown of its stages
+    """
+
+    def __init__(self, tracer, name, attributes):
+        super().__init__(tracer, name, attributes)
+        self.timestamp = None
+        self.duration = None
+        self.stages = {}
+
+    def add(self, stage, seconds, attributes):
+        totals = self.stages.setdefault(stage, {"seconds": 0.0, "calls": 0})
+        totals["seconds"] += seconds
+        totals["calls"] += 1
+        for key, value in attributes.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                totals[key] = totals.get(key, 0) + value
+
+    def __enter__(self):
+        self.timestamp = time.time()
+        self.tracer._local.trace = self
+        return super().__enter__()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        self.tracer._stack().remove(self)
+        self.tracer._local.trace = None
+        if exc_type is not None:
+            self.attributes["error"] = str(exc)
+        self.tracer._finish(self)
+        return False
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "timestamp": self.timestamp,
+            "duration": self.duration,
+            "attributes": self.attributes,
+            "stages": self.stages,
+        }
+
+class JsonlSink:
+    """
+    Append every finished trace to a JSON Lines file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def export(self, trace, tracer):
+        line = json.dumps(trace.to_dict(), default=str)
+        with self._lock, open(self.path, "a") as f:
+            f.write(line + "\n")
+
+class PrometheusTextSink:
+    """
+    Rewrite a Prometheus text-format metrics file (e.g. for the node exporter's
+    textfile collector) after every finished trace
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def export(self, trace, tracer):
+        text = tracer.prometheus_text()
+        with self._lock:
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                f.write(text)
+            os.replace(tmp_path, self.path)
+
+class Tracer:
+    """
+    Record per-stage latencies of ingestion and question answering
+
+    ``trace`` marks a request boundary and ``span``/``timed`` its stages. Stage times
+    of a finished trace are aggregated into histograms and counters and handed to
+    every sink. Spans outside a trace go straight into the histograms. While
+    disabled, ``trace`` and ``span`` return a shared no-op object and ``timed``
+    returns the iterable unchanged.
+    """
+
+    def __init__(self, enabled=False, sinks=()):
+        self.enabled = enabled
+        self.sinks = list(sinks)
+        self.histograms = defaultdict(Histogram)
+        self.counters = defaultdict(float)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def configure(self, enabled=True, sinks=()):
+        self.enabled = enabled
+        self.sinks = list(sinks)
+        return self
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def trace(self, name, **attributes):
+        """Context manager timing one request; a trace inside another acts as a span"""
+        if not self.enabled:
+            return NULL_SPAN
+        if getattr(self._local, "trace", None) is not None:
+            return Span(self, name, attributes)
+        return Trace(self, name, attributes)
+
+    def span(self, name, **attributes):
+        """Context manager timing one stage of the current request"""
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, attributes)
+
+    def timed(self, name, iterable, item=None):
+        """
+        Attribute the time spent producing each item of ``iterable`` to stage ``name``,
+        counting the items as ``item`` (e.g. "pages")
+        """
+        if not self.enabled:
+            return iterable
+        return self._timed(name, iter(iterable), item)
+
+    def _timed(self, name, iterator, item):
+        while True:
+            with self.span(name) as span:
+                try:
+                    value = next(iterator)
+                except StopIteration:
+                    return
+                if item:
+                    span.set(**{item: 1})
+            yield value
+
+    def pop_last_trace(self):
+        """Return and forget the last trace finished on the calling thread, if any"""
+        trace = getattr(self._local, "last_trace", None)
+        self._local.last_trace = None
+        return trace
+
+    def _record(self, stage, seconds, attributes):
+        trace = getattr(self._local, "trace", None)
+        if trace is not None:
+            trace.add(stage, seconds, attributes)
+            return
+        with self._lock:
+            self.histograms[stage].observe(seconds)
+            self._count(stage, attributes)
+
+    def _count(self, stage, attributes):
+        for key, value in attributes.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                self.counters[(stage, key)] += value
+
+    def _finish(self, trace):
+        self._local.last_trace = trace
+        with self._lock:
+            self.histograms[trace.name].observe(trace.duration)
+            self.counters[(trace.name, "requests")] += 1
+            for stage, totals in trace.stages.items():
+                self.histograms[stage].observe(totals["seconds"])
+                self._count(stage, {k: v for k, v in totals.items() if k != "seconds"})
+        for sink in self.sinks:
+            sink.export(trace, self)
+
+    def prometheus_text(self):
+        """Current histograms and counters in the Prometheus text exposition format"""
+        lines = [
+            "# HELP rag_stage_seconds Time spent per request in each pipeline stage",
+            "# TYPE rag_stage_seconds histogram",
+        ]
+        with self._lock:
+            for stage, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+                    cumulative += count
+                    lines.append(f'rag_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'rag_stage_seconds_sum{{stage="{stage}"}} {histogram.sum}')
+                lines.append(f'rag_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+            lines.append("# HELP rag_stage_items_total Items processed per pipeline stage")
+            lines.append("# TYPE rag_stage_items_total counter")
+            for (stage, item), value in sorted(self.counters.items()):
+                lines.append(f'rag_stage_items_total{{stage="{stage}",item="{item}"}} {value:g}')
+        return "\n".join(lines) + "\n"
+
+# Process-wide tracer used by the instrumented modules; disabled until configured
+tracer = Tracer()
@@ -0,0 +1,160 @@
+import json
+import time
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict
+
+logger = logging.getLogger(__name__)
+
+class UpsertError(Exception):
+    """Raised when some vector store writes still failed after all retries"""
+
+def _vector_size(vector):
+    """Rough serialized size of a vector record, used to keep requests under the size limit"""
+    return len(vector["id"]) + 10 * len(vector["values"]) + len(json.dumps(vector.get("metadata") or {}))
+
+class UpsertWriter:
+    """
+    Write vectors to a vector store in size-bounded batches from a bounded thread pool
+
+    Batches are capped by vector count and approximate request size and retried with
+    exponential backoff. At most ``max_pending`` batches may be queued or in flight;
+    beyond that ``upsert`` blocks, which throttles whatever is producing vectors.
+    Call ``close`` (or use the writer as a context manager) to wait for all writes;
+    it raises UpsertError if any batch ultimately failed. ``on_written(operation,
+    count)`` is called from the writer threads after each successful batch. All
+    writes go to the vector store ``namespace`` (None for the default one).
+    """
+
+    def __init__(self, index, max_batch_size=100, max_batch_bytes=2_000_000, max_workers=4,
+                 max_pending=None, max_retries=3, backoff_seconds=0.5, on_written=None, namespace=None):
+        self.index = index
+        self.namespace = namespace
+        self.on_written = on_written
+        self.max_batch_size = max_batch_size
+        self.max_batch_bytes = max_batch_bytes
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.batch_stats = []
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="upsert")
+        self._slots = threading.BoundedSemaphore(max_pending or 2 * max_workers)
+        self._futures = []
+        self._stats_lock = threading.Lock()
+
+    def _split(self, vectors):
+        batch, batch_bytes = [], 0
+        for vector in vectors:
+            size = _vector_size(vector)
+            if batch and (len(batch) >= self.max_batch_size or batch_bytes + size > self.max_batch_bytes):
+                yield batch
+                batch, batch_bytes = [], 0
+            batch.append(vector)
+            batch_bytes += size
+        if batch:
+            yield batch
+
+    def _submit(self, operation, size, func):
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(self._run, operation, size, func)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(future)
+
+    def _run(self, operation, size, func):
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                func()
+                error = None
+                break
+            except Exception as e:
+                error = e
+                if attempt > self.max_retries:
+                    break
+                delay = self.backoff_seconds * (2 ** (attempt - 1)) * (0.5 + random.random())
+                logger.warning("%s of %d vectors failed (attempt %d): %s; retrying in %.2fs",
+                               operation, size, attempt, e, delay)
+                time.sleep(delay)
+
+        stats = {
+            "operation": operation,
+            "size": size,
+            "attempts": attempt,
+            "latency": time.perf_counter() - start,
+            "error": str(error) if error else None,
+        }
+        with self._stats_lock:
+            self.batch_stats.append(stats)
+        if error:
+            logger.error("%s of %d vectors failed after %d attempts: %s", operation, size, attempt, error)
+        else:
+            logger.debug("%s of %d vectors took %.3fs", operation, size, stats["latency"])
+            if self.on_written:
+                self.on_written(operation, size)
+        return stats
+
+    def upsert(self, vectors: List[Dict]):
+        """
+        Queue vectors for upserting, blocking while too many batches are in flight
+        """
+        for batch in self._split(vectors):
+            self._submit("upsert", len(batch), lambda batch=batch: self.index.upsert(vectors=batch, namespace=self.namespace))
+
+    def delete(self, ids: List[str], batch_size=1000):
+        """
+        Queue deletion of vectors by id
+        """
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            self._submit("delete", len(batch), lambda batch=batch: self.index.delete(ids=batch, namespace=self.namespace))
+
+    def summary(self):
+        """
+        Aggregate batch statistics: counts, failures and latency percentiles
+        """
+        with self._stats_lock:
+            stats = list(self.batch_stats)
+        latencies = sorted(s["latency"] for s in stats)
+        return {
+            "batches": len(stats),
+            "vectors": sum(s["size"] for s in stats if s["operation"] == "upsert" and not s["error"]),
+            "deleted": sum(s["size"] for s in stats if s["operation"] == "delete" and not s["error"]),
+            "failed_batches": sum(1 for s in stats if s["error"]),
+            "retries": sum(s["attempts"] - 1 for s in stats),
+            "latency_p50": latencies[len(latencies) // 2] if latencies else 0.0,
+            "latency_max": latencies[-1] if latencies else 0.0,
+        }
+
+    def close(self):
+        """
+        Wait for all queued writes and raise UpsertError if any of them failed
+        """
+        try:
+            results = [future.result() for future in self._futures]
+        finally:
+            self._executor.shutdown(wait=True)
+        failures = [stats for stats in results if stats["error"]]
+        if failures:
+            raise UpsertError(
+                f"{len(failures)} of {len(self._futures)} vector store batches failed: {failures[0]['error']}"
+            )
+        return self.summary()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            for future in self._futures:
+                future.cancel()
+            self._executor.shutdown(wait=True)
+        return False
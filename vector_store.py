@@ -0,0 +1,260 @@
+import os
+import json
+import sqlite3
+import threading
+import numpy as np
+from collections import namedtuple
+from typing import List, Dict
+
+Match = namedtuple("Match", ["id", "score", "metadata"])
+QueryResult = namedtuple("QueryResult", ["matches"])
+Vector = namedtuple("Vector", ["id", "values", "metadata"])
+FetchResult = namedtuple("FetchResult", ["vectors"])
+
+class VectorStore:
+    """
+    Minimal vector store interface used by the ingestion and retrieval code
+
+    It mirrors the subset of the Pinecone ``Index`` API the app relies on, so a
+    Pinecone index can be used directly wherever a VectorStore is expected.
+    """
+
+    def upsert(self, vectors: List[Dict], namespace=None):
+        raise NotImplementedError
+
+    def delete(self, ids: List[str] = None, delete_all=False, namespace=None):
+        raise NotImplementedError
+
+    def query(self, vector, top_k=5, include_metadata=True, filter=None, namespace=None) -> QueryResult:
+        raise NotImplementedError
+
+    def fetch(self, ids: List[str], namespace=None) -> FetchResult:
+        raise NotImplementedError
+
+class LocalVectorStore(VectorStore):
+    """
+    Exact cosine-similarity index kept on local disk
+
+    Vectors are L2-normalised and stored in a memory-mapped float32 (or float16)
+    matrix; ids and metadata live in a SQLite side table mapping ids to matrix rows.
+    Queries are a single matrix-vector product followed by an argpartition top-k.
+    As in Pinecone, vectors live in namespaces (None is the default namespace) and
+    a query only scores the rows of its own namespace.
+    """
+
+    def __init__(self, path, dimension, dtype="float32", initial_capacity=1024):
+        os.makedirs(path, exist_ok=True)
+        self.dimension = dimension
+        self.dtype = np.dtype(dtype)
+        self._matrix_path = os.path.join(path, f"vectors.{self.dtype.name}")
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(os.path.join(path, "metadata.sqlite3"), check_same_thread=False)
+        self._create_table()
+
+        self._ids = {}               # (namespace, id) -> row
+        self._row_ids = {}           # row -> (namespace, id)
+        self._namespace_rows = {}    # namespace -> set of rows
+        self._metadata = {}
+        self._sources = {}
+        self._row_sources = np.full(0, -1, dtype=np.int32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._vectors = None
+
+        rows = self._conn.execute("SELECT row, namespace, id, source, metadata FROM vectors").fetchall()
+        capacity = max(initial_capacity, max((row for row, *_ in rows), default=-1) + 1)
+        self._open_matrix(capacity)
+        for row, namespace, vector_id, source, metadata in rows:
+            self._assign(row, namespace, vector_id)
+            self._metadata[row] = json.loads(metadata)
+            self._row_sources[row] = self._source_code(source)
+            self._alive[row] = True
+
+    def _create_table(self):
+        columns = [name for _, name, *_ in self._conn.execute("PRAGMA table_info(vectors)")]
+        if columns and "namespace" not in columns:
+            # Indexes written before namespaces existed: their vectors move to the default namespace
+            self._conn.execute("ALTER TABLE vectors RENAME TO vectors_unscoped")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS vectors ("
+            "row INTEGER PRIMARY KEY, namespace TEXT NOT NULL, id TEXT NOT NULL, source TEXT, metadata TEXT NOT NULL, "
+            "UNIQUE (namespace, id))"
+        )
+        if columns and "namespace" not in columns:
+            self._conn.execute(
+                "INSERT INTO vectors SELECT row, '', id, source, metadata FROM vectors_unscoped"
+            )
+            self._conn.execute("DROP TABLE vectors_unscoped")
+        self._conn.commit()
+
+    def _assign(self, row, namespace, vector_id):
+        self._ids[(namespace, vector_id)] = row
+        self._row_ids[row] = (namespace, vector_id)
+        self._namespace_rows.setdefault(namespace, set()).add(row)
+
+    def _release(self, row):
+        namespace, vector_id = self._row_ids.pop(row)
+        del self._ids[(namespace, vector_id)]
+        del self._metadata[row]
+        rows = self._namespace_rows[namespace]
+        rows.discard(row)
+        if not rows:
+            del self._namespace_rows[namespace]
+
+    def namespaces(self):
+        """Vector counts by namespace ("" is the default namespace)"""
+        with self._lock:
+            return {namespace: len(rows) for namespace, rows in self._namespace_rows.items()}
+
+    def _open_matrix(self, capacity):
+        """Open (or grow) the memory-mapped vector matrix to hold at least ``capacity`` rows"""
+        row_bytes = self.dimension * self.dtype.itemsize
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+        open(self._matrix_path, "ab").close()
+        capacity = max(capacity, os.path.getsize(self._matrix_path) // row_bytes)
+        if os.path.getsize(self._matrix_path) < capacity * row_bytes:
+            with open(self._matrix_path, "r+b") as f:
+                f.truncate(capacity * row_bytes)
+        self._vectors = np.memmap(self._matrix_path, dtype=self.dtype, mode="r+", shape=(capacity, self.dimension))
+
+        grown = capacity - len(self._alive)
+        self._alive = np.concatenate([self._alive, np.zeros(grown, dtype=bool)])
+        self._row_sources = np.concatenate([self._row_sources, np.full(grown, -1, dtype=np.int32)])
+
+    def _source_code(self, source):
+        if source is None:
+            return -1
+        return self._sources.setdefault(source, len(self._sources))
+
+    def _free_rows(self, count):
+        free = np.flatnonzero(~self._alive)
+        if len(free) < count:
+            self._open_matrix(max(2 * len(self._alive), len(self._alive) + count - len(free)))
+            free = np.flatnonzero(~self._alive)
+        return free[:count]
+
+    def upsert(self, vectors: List[Dict], namespace=None):
+        """
+        Insert or overwrite vectors given as Pinecone-style ``{"id", "values", "metadata"}`` dicts
+        """
+        if not vectors:
+            return {"upserted_count": 0}
+        namespace = namespace or ""
+        with self._lock:
+            new_ids = [v["id"] for v in vectors if (namespace, v["id"]) not in self._ids]
+            free_rows = iter(self._free_rows(len(set(new_ids))).tolist())
+
+            values = np.asarray([v["values"] for v in vectors], dtype=np.float32)
+            norms = np.linalg.norm(values, axis=1, keepdims=True)
+            values /= np.maximum(norms, 1e-12)
+
+            records = []
+            rows = []
+            for vector in vectors:
+                row = self._ids.get((namespace, vector["id"]))
+                if row is None:
+                    row = next(free_rows)
+                    self._assign(row, namespace, vector["id"])
+                metadata = vector.get("metadata") or {}
+                self._metadata[row] = metadata
+                self._row_sources[row] = self._source_code(metadata.get("source"))
+                self._alive[row] = True
+                rows.append(row)
+                records.append((row, namespace, vector["id"], metadata.get("source"), json.dumps(metadata)))
+
+            self._vectors[rows] = values.astype(self.dtype)
+            self._vectors.flush()
+            self._conn.executemany("INSERT OR REPLACE INTO vectors VALUES (?, ?, ?, ?, ?)", records)
+            self._conn.commit()
+        return {"upserted_count": len(vectors)}
+
+    def delete(self, ids: List[str] = None, delete_all=False, namespace=None):
+        """
+        Delete vectors by id, or the whole namespace with ``delete_all``; unknown ids are ignored
+        """
+        namespace = namespace or ""
+        with self._lock:
+            if delete_all:
+                rows = sorted(self._namespace_rows.get(namespace, ()))
+            else:
+                rows = [self._ids[(namespace, vector_id)] for vector_id in ids or () if (namespace, vector_id) in self._ids]
+            for row in rows:
+                self._release(row)
+            self._alive[rows] = False
+            self._row_sources[rows] = -1
+            self._conn.executemany("DELETE FROM vectors WHERE row = ?", [(row,) for row in rows])
+            self._conn.commit()
+        return {}
+
+    def _filter_rows(self, rows, filter):
+        """Narrow candidate rows down with a Pinecone-style filter on ``source``"""
+        if not filter:
+            return rows
+        unsupported = set(filter) - {"source"}
+        if unsupported:
+            raise ValueError(f"LocalVectorStore only supports filtering on 'source', got {sorted(unsupported)}")
+
+        condition = filter["source"]
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        sources = self._row_sources[rows]
+        mask = np.ones(len(rows), dtype=bool)
+        for op, value in condition.items():
+            if op == "$eq":
+                mask &= sources == self._sources.get(value, -2)
+            elif op == "$ne":
+                mask &= sources != self._sources.get(value, -2)
+            elif op == "$in":
+                mask &= np.isin(sources, [self._sources.get(v, -2) for v in value])
+            elif op == "$nin":
+                mask &= ~np.isin(sources, [self._sources.get(v, -2) for v in value])
+            else:
+                raise ValueError(f"Unsupported filter operator: {op}")
+        return rows[mask]
+
+    def query(self, vector, top_k=5, include_metadata=True, filter=None, namespace=None) -> QueryResult:
+        """
+        Return the ``top_k`` most cosine-similar vectors of a namespace, optionally filtered by ``source``
+        """
+        query = np.array(vector, dtype=np.float32)
+        query /= max(np.linalg.norm(query), 1e-12)
+
+        with self._lock:
+            rows = self._namespace_rows.get(namespace or "", ())
+            # Sorted, so a namespace spanning the whole matrix can be scored without a gather
+            candidates = self._filter_rows(np.sort(np.fromiter(rows, dtype=np.int64, count=len(rows))), filter)
+            if not len(candidates) or top_k <= 0:
+                return QueryResult(matches=[])
+
+            if len(candidates) == len(self._alive):
+                scores = self._vectors.astype(np.float32, copy=False) @ query
+            else:
+                scores = self._vectors[candidates].astype(np.float32, copy=False) @ query
+
+            k = min(top_k, len(candidates))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+
+            matches = []
+            for i in top:
+                row = int(candidates[i])
+                matches.append(Match(
+                    id=self._row_ids[row][1],
+                    score=float(scores[i]),
+                    metadata=self._metadata[row] if include_metadata else None
+                ))
+        return QueryResult(matches=matches)
+
+    def fetch(self, ids: List[str], namespace=None) -> FetchResult:
+        """
+        Return the stored vectors and metadata of the given ids in a namespace; unknown ids are left out
+        """
+        namespace = namespace or ""
+        with self._lock:
+            vectors = {}
+            for vector_id in ids:
+                row = self._ids.get((namespace, vector_id))
+                if row is not None:
+                    vectors[vector_id] = Vector(vector_id, self._vectors[row].astype(np.float32).tolist(), self._metadata[row])
+        return FetchResult(vectors=vectors)